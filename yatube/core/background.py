@@ -0,0 +1,73 @@
+"""
+Фоновые пулы потоков процесса веб-сервера.
+
+Задача ставится в пул после коммита транзакции, а ключ, который уже
+ждёт в очереди, второй раз не ставится. Пулы запускает только процесс
+веб-сервера, см. yatube/wsgi.py. В тестах, командах и shell задачи не
+ставятся: их работу доделывают management-команды.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+
+workers_started = False
+
+
+def start_workers():
+    """Разрешает процессу выполнять задачи в фоновых пулах."""
+    global workers_started
+    workers_started = True
+
+
+class Pool:
+    """
+    Пул, выполняющий func(key) в фоне; error - сообщение в лог
+    модуля func, если задача упала.
+    """
+
+    def __init__(self, name, func, error, max_workers=1):
+        self.name = name
+        self.func = func
+        self.error = error
+        self.max_workers = max_workers
+        self.logger = logging.getLogger(func.__module__)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._queued = set()
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name,
+                )
+            return self._executor
+
+    def run(self, key):
+        try:
+            self.func(key)
+        except Exception:
+            self.logger.exception(self.error, key)
+        finally:
+            with self._lock:
+                self._queued.discard(key)
+            connection.close()
+
+    def depth(self):
+        """Сколько ключей ждут или выполняются в пуле."""
+        return len(self._queued)
+
+    def queue(self, key):
+        """Ставит func(key) в пул после коммита; без пула ничего не делает."""
+        def submit():
+            with self._lock:
+                if key in self._queued:
+                    return
+                self._queued.add(key)
+            self.get_executor().submit(self.run, key)
+
+        if workers_started:
+            transaction.on_commit(submit)
@@ -0,0 +1,323 @@
+"""
+Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+Файл открыт в режиме WAL: читатели не ждут писателя, а запись
+идёт короткими транзакциями BEGIN IMMEDIATE, поэтому add и incr
+атомарны между воркерами. Число записей и их суммарный размер
+ведут триггеры, и при превышении MAX_ENTRIES или MAX_SIZE
+вытесняются давно не читанные записи.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.sqlite.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube/cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000, 'MAX_SIZE': 64 * 2 ** 20},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from core import timing
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    '''
+    CREATE TABLE IF NOT EXISTS cache_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        entries INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )
+    ''',
+    'INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache
+    BEGIN
+        UPDATE cache_stats
+        SET entries = entries + 1, size = size + NEW.size;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_stats SET size = size - OLD.size + NEW.size;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache
+    BEGIN
+        UPDATE cache_stats
+        SET entries = entries - 1, size = size - OLD.size;
+    END
+    ''',
+)
+
+UPSERT = '''
+    INSERT INTO cache (key, value, expires, accessed, size)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        value = excluded.value,
+        expires = excluded.expires,
+        accessed = excluded.accessed,
+        size = excluded.size
+'''
+
+# Время чтения обновляется не чаще раза в столько секунд,
+# чтобы горячие ключи не превращали каждое чтение в запись.
+ACCESS_RESOLUTION = 1
+# Сколько записей вытеснять за один DELETE.
+CULL_BATCH = 100
+
+MISSING = object()
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = os.path.abspath(location)
+        self._max_size = options.get('MAX_SIZE')
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # Соединение своё у каждого потока и у каждого процесса после fork.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        connection = sqlite3.connect(
+            self._path,
+            timeout=self._busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        with self._transaction(connection):
+            for statement in SCHEMA:
+                connection.execute(statement)
+        return connection
+
+    @contextmanager
+    def _transaction(self, connection=None):
+        connection = connection or self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _dump(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _load(self, key, value, expires, accessed, now):
+        """Значение строки или MISSING, если она устарела."""
+        if expires is not None and expires <= now:
+            self._connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now),
+            )
+            return MISSING
+        if now - accessed > ACCESS_RESOLUTION:
+            self._connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+        return pickle.loads(value)
+
+    def _select(self, keys):
+        placeholders = ', '.join('?' * len(keys))
+        return self._connection.execute(
+            'SELECT key, value, expires, accessed FROM cache '
+            f'WHERE key IN ({placeholders})',
+            keys,
+        ).fetchall()
+
+    def _write(self, connection, key, value, timeout, now):
+        data = self._dump(value)
+        connection.execute(
+            UPSERT,
+            (key, data, self.get_backend_timeout(timeout), now, len(data)),
+        )
+
+    def _cull(self, connection, now):
+        """Вытесняет записи, если кэш вышел за MAX_ENTRIES или MAX_SIZE."""
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats'
+        ).fetchone()
+        if not self._over_limits(entries, size):
+            return
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        # Как и в LocMemCache, освобождаем сразу долю кэша,
+        # чтобы не вытеснять по записи на каждый set.
+        cull_frequency = max(self._cull_frequency, 1)
+        target_entries = self._max_entries - (
+            self._max_entries // cull_frequency
+        )
+        target_size = None
+        if self._max_size is not None:
+            target_size = self._max_size - self._max_size // cull_frequency
+        while True:
+            entries, size = connection.execute(
+                'SELECT entries, size FROM cache_stats'
+            ).fetchone()
+            excess = entries - target_entries
+            if target_size is not None and size > target_size:
+                # Сколько записей среднего размера занимает излишек.
+                excess = max(
+                    excess, -(-(size - target_size) * entries // size)
+                )
+            if excess <= 0:
+                return
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (min(excess, CULL_BATCH),),
+            )
+
+    def _over_limits(self, entries, size):
+        if entries > self._max_entries:
+            return True
+        return self._max_size is not None and size > self._max_size
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        with timing.measure('cache'):
+            rows = self._select([key])
+            value = self._load(*rows[0], now=time.time()) if rows else MISSING
+        if value is MISSING:
+            timing.count('cache_misses')
+            return default
+        timing.count('cache_hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        keys_map = {self._key(key, version): key for key in keys}
+        if not keys_map:
+            return {}
+        now = time.time()
+        found = {}
+        with timing.measure('cache'):
+            for row in self._select(list(keys_map)):
+                value = self._load(*row, now=now)
+                if value is not MISSING:
+                    found[keys_map[row[0]]] = value
+        timing.count('cache_hits', len(found))
+        timing.count('cache_misses', len(keys_map) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            self._write(connection, key, value, timeout, now)
+            self._cull(connection, now)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._transaction() as connection:
+            for key, value in data.items():
+                key = self._key(key, version)
+                self._write(connection, key, value, timeout, now)
+            self._cull(connection, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            exists = connection.execute(
+                'SELECT 1 FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if exists:
+                return False
+            self._write(connection, key, value, timeout, now)
+            self._cull(connection, now)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            data = self._dump(value)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?',
+                (data, len(data), now, key),
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), now, key, now),
+            )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+            )
+
+    def clear(self):
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM cache')
@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = (
+    ('locmem', 'django.core.cache.backends.locmem.LocMemCache'),
+    ('file', 'django.core.cache.backends.filebased.FileBasedCache'),
+    ('sqlite', 'core.cache_backends.sqlite.SQLiteCache'),
+)
+COUNTER = 'benchmark_counter'
+# Каждая такая по счёту операция - incr общего счётчика.
+INCR_EVERY = 10
+
+
+def create_cache(backend, directory, keys):
+    location = {
+        'locmem': directory,
+        'file': os.path.join(directory, 'files'),
+        'sqlite': os.path.join(directory, 'cache.sqlite3'),
+    }
+    path = dict(BACKENDS)[backend]
+    return import_string(path)(
+        location[backend], {'OPTIONS': {'MAX_ENTRIES': keys * 2}}
+    )
+
+
+def worker(backend, directory, keys, ops, value, results):
+    """Читает ключи как cache_page: промах - вычисление и запись."""
+    cache = create_cache(backend, directory, keys)
+    generator = random.Random(os.getpid())
+    hits = incrs = 0
+    start = time.perf_counter()
+    for i in range(ops):
+        if i % INCR_EVERY == 0:
+            cache.incr(COUNTER)
+            incrs += 1
+            continue
+        key = f'page:{generator.randrange(keys)}'
+        if cache.get(key) is None:
+            cache.set(key, value)
+        else:
+            hits += 1
+    results.put((time.perf_counter() - start, hits, ops - incrs, incrs))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает бэкенды кэша под нагрузкой из нескольких процессов: '
+        'пропускную способность, долю попаданий и потерю incr.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--ops', type=int, default=5000)
+        parser.add_argument('--keys', type=int, default=500)
+        parser.add_argument('--value-size', type=int, default=4096)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"бэкенд":<8}{"процессов":>10}{"опер/с":>10}'
+            f'{"попаданий":>11}{"incr видно":>12}'
+        )
+        for backend, _ in BACKENDS:
+            with tempfile.TemporaryDirectory() as directory:
+                self.benchmark(
+                    backend, directory, options['workers'], options['ops'],
+                    options['keys'], os.urandom(options['value_size']),
+                )
+
+    def benchmark(self, backend, directory, workers, ops, keys, value):
+        cache = create_cache(backend, directory, keys)
+        cache.clear()
+        cache.set(COUNTER, 0, None)
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=worker,
+                args=(backend, directory, keys, ops, value, results),
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        elapsed = max(seconds for seconds, *_ in stats)
+        hits = sum(hit for _, hit, _, _ in stats)
+        reads = sum(read for _, _, read, _ in stats)
+        incrs = sum(incr for *_, incr in stats)
+        # LocMemCache у каждого процесса свой, и родитель
+        # не видит ни одного incr воркеров.
+        seen = cache.get(COUNTER)
+        self.stdout.write(
+            f'{backend:<8}{workers:>10}{workers * ops / elapsed:>10.0f}'
+            f'{hits / reads:>11.1%}{f"{seen}/{incrs}":>12}'
+        )
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает токен для заголовка X-Profile: один запрос с ним '
+        'к указанному пути выполняется под профилировщиком.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь запроса, например /group/x/.')
+        parser.add_argument(
+            '--memory', action='store_true',
+            help='Снимать ещё и выделения памяти через tracemalloc.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path.startswith('/'):
+            raise CommandError('Путь должен начинаться с /.')
+        token = profiling.make_token(
+            path, 'memory' if options['memory'] else 'cpu'
+        )
+        self.stdout.write(token)
+        self.stderr.write(
+            f'Один запрос в течение {settings.PROFILE_TOKEN_MAX_AGE} с: '
+            f'curl -H "X-Profile: {token}" ...{path}'
+        )
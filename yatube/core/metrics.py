@@ -0,0 +1,320 @@
+"""
+Метрики процессов сайта в текстовом формате Prometheus.
+
+Запрос пишет счётчики и гистограммы в словари своего потока без
+блокировок: блокировка берётся только при первой записи нового
+потока. Фоновый поток процесса раз в METRICS_FLUSH_INTERVAL секунд
+складывает словари всех потоков и записывает снимок процесса строкой
+в общий файл SQLite METRICS_DB. Страница метрик суммирует снимки
+всех воркеров.
+
+Снимок читает словари, пока потоки в них пишут. Копия словаря
+и списка гистограммы делается одной операцией под GIL, но корзина,
+сумма и число значений гистограммы могут разойтись на значение,
+записанное в этот момент. Все поля только растут, поэтому такой
+снимок лишь немного отстаёт, а следующий его догоняет.
+
+Сервер может заводить поток на каждое соединение, поэтому метрики
+завершившегося потока переносятся в общий итог процесса: число
+словарей не растёт с числом обслуженных запросов.
+
+Снимок хранит накопленные с запуска процесса значения, поэтому
+счётчики завершившегося воркера остаются в сумме, пока его строка
+не старше METRICS_RETENTION. Датчики (gauge) суммируются только по
+живым воркерам, которые писали снимок недавно.
+"""
+import atexit
+import bisect
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+# Границы корзин гистограммы времени ответа, в секундах.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Описания метрик для # HELP, по имени.
+HELP = {
+    'yatube_http_requests_total': 'Ответы по представлению и статусу.',
+    'yatube_http_request_duration_seconds': 'Время ответа представления.',
+    'yatube_db_queries_total': 'Запросы к базе по представлению.',
+    'yatube_db_query_seconds_total': 'Время запросов к базе.',
+    'yatube_cache_hits_total': 'Попадания в кэш по представлению.',
+    'yatube_cache_misses_total': 'Промахи кэша по представлению.',
+    'yatube_workers': 'Воркеры, недавно записавшие метрики.',
+}
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS snapshots (
+        worker TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated REAL NOT NULL
+    )
+'''
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+# Датчики: имя -> функция без аргументов.
+_gauges = {}
+_worker = None
+_flusher = None
+_retired = None
+# Меняется при fork: потоки родителя не переносят метрики в потомка.
+_generation = 0
+
+
+class Shard:
+    """Метрики одного потока."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def copy(self):
+        histograms = list(self.histograms.items())
+        return (
+            dict(self.counters),
+            {key: list(value) for key, value in histograms},
+        )
+
+    def add(self, counters, histograms):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, value in histograms.items():
+            _add_histogram(self.histograms, key, value)
+
+
+class Owner:
+    """Лежит только в threading.local и умирает вместе с потоком."""
+
+
+def _reset():
+    """Новый процесс начинает с пустых метрик и своего воркера."""
+    global _worker, _flusher, _shards_lock, _retired, _generation
+    _generation += 1
+    _shards.clear()
+    _shards_lock = threading.Lock()
+    _retired = Shard()
+    _local.__dict__.clear()
+    _worker = f'{socket.gethostname()}:{os.getpid()}:{time.time():.0f}'
+    _flusher = None
+
+
+_reset()
+os.register_at_fork(after_in_child=_reset)
+
+
+def _retire(generation, shard):
+    """Переносит метрики завершившегося потока в итог процесса."""
+    if generation != _generation:
+        return
+    with _shards_lock:
+        _shards.remove(shard)
+        _retired.add(*shard.copy())
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = Shard()
+        owner = _local.owner = Owner()
+        weakref.finalize(owner, _retire, _generation, shard)
+        with _shards_lock:
+            _shards.append(shard)
+        _local.shard = shard
+        _start_flusher()
+    return shard
+
+
+def inc(name, labels, value=1):
+    """Увеличивает счётчик; labels - кортеж пар (метка, значение)."""
+    shard = _shard()
+    key = (name, labels)
+    shard.counters[key] = shard.counters.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    """Добавляет значение в гистограмму с корзинами BUCKETS."""
+    shard = _shard()
+    key = (name, labels)
+    histogram = shard.histograms.get(key)
+    if histogram is None:
+        # Корзины без накопления, +Inf, сумма и число значений.
+        histogram = shard.histograms[key] = (
+            [0] * (len(BUCKETS) + 1) + [0.0, 0]
+        )
+    histogram[bisect.bisect_left(BUCKETS, value)] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+def gauge(name, description, func):
+    """Регистрирует датчик: func вызывается при каждом снимке."""
+    HELP[name] = description
+    _gauges[name] = func
+
+
+def snapshot():
+    """Метрики процесса: суммы по всем потокам и значения датчиков."""
+    # Итог завершившихся потоков и список живых берутся вместе: поток,
+    # завершившийся позже, уже посчитан как живой и не попадёт дважды.
+    with _shards_lock:
+        shards = list(_shards)
+        total = Shard()
+        total.add(*_retired.copy())
+    for shard in shards:
+        total.add(*shard.copy())
+    return {
+        'counters': [[name, labels, value]
+                     for (name, labels), value in total.counters.items()],
+        'histograms': [[name, labels, value]
+                       for (name, labels), value in total.histograms.items()],
+        'gauges': {name: func() for name, func in _gauges.items()},
+    }
+
+
+def _add_histogram(histograms, key, value):
+    total = histograms.get(key)
+    if total is None:
+        histograms[key] = list(value)
+    else:
+        for index, item in enumerate(value):
+            total[index] += item
+
+
+def _connect():
+    path = settings.METRICS_DB
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute(SCHEMA)
+    return connection
+
+
+def flush():
+    """Записывает снимок процесса в общий файл."""
+    data = json.dumps(snapshot())
+    connection = _connect()
+    try:
+        connection.execute(
+            'INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)',
+            (_worker, data, time.time()),
+        )
+    finally:
+        connection.close()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except sqlite3.Error:
+            # Файл занят или недоступен - попробуем в следующий раз.
+            pass
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _shards_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(
+                target=_flush_forever, name='metrics', daemon=True
+            )
+            _flusher.start()
+
+
+@atexit.register
+def _flush_at_exit():
+    if _flusher is not None:
+        try:
+            flush()
+        except sqlite3.Error:
+            pass
+
+
+def collect():
+    """Сумма снимков всех воркеров, не старше METRICS_RETENTION."""
+    now = time.time()
+    connection = _connect()
+    try:
+        connection.execute(
+            'DELETE FROM snapshots WHERE updated < ?',
+            (now - settings.METRICS_RETENTION,),
+        )
+        rows = connection.execute(
+            'SELECT data, updated FROM snapshots'
+        ).fetchall()
+    finally:
+        connection.close()
+    counters = {}
+    histograms = {}
+    gauges = {'yatube_workers': 0}
+    alive = now - settings.METRICS_FLUSH_INTERVAL * 3
+    for data, updated in rows:
+        data = json.loads(data)
+        for name, labels, value in data['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            _add_histogram(histograms, key, value)
+        if updated >= alive:
+            gauges['yatube_workers'] += 1
+            for name, value in data['gauges'].items():
+                gauges[name] = gauges.get(name, 0) + value
+    return counters, histograms, gauges
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+        for _, value in pairs
+    )
+    return '{' + ','.join(
+        f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)
+    ) + '}'
+
+
+def _header(lines, name, kind):
+    lines.append(f'# HELP {name} {HELP.get(name, name)}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def exposition():
+    """Метрики всех воркеров в текстовом формате Prometheus 0.0.4."""
+    counters, histograms, gauges = collect()
+    lines = []
+    seen = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            _header(lines, name, 'counter')
+        lines.append(f'{name}{_labels(labels)} {value}')
+    for (name, labels), value in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            _header(lines, name, 'histogram')
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, '+Inf'), value):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{_labels(labels, [("le", bound)])} '
+                f'{cumulative}'
+            )
+        lines.append(f'{name}_sum{_labels(labels)} {value[-2]}')
+        lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+    for name, value in sorted(gauges.items()):
+        _header(lines, name, 'gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
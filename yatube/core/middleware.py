@@ -0,0 +1,118 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, profiling, timing
+
+logger = logging.getLogger('core.timing')
+
+
+class ServerTimingMiddleware:
+    """
+    Замеряет запрос: SQL, шаблоны, кэш и миниатюры. Итог уходит
+    в заголовок Server-Timing и строкой JSON в лог core.timing
+    с именем представления.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = timing.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timing.sql)
+                    )
+                response = self.get_response(request)
+            response['Server-Timing'] = timings.header()
+            if logger.isEnabledFor(logging.INFO):
+                match = request.resolver_match
+                logger.info(json.dumps({
+                    'view': match.view_name if match else None,
+                    'method': request.method,
+                    'status': response.status_code,
+                    **timings.as_dict(),
+                }))
+        finally:
+            timing.stop()
+        return response
+
+
+# Прочие методы пишутся как other: клиент не может плодить ряды метрик.
+METHODS = frozenset((
+    'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE',
+    'CONNECT',
+))
+
+
+class MetricsMiddleware:
+    """
+    Пишет в метрики процесса ответ представления: статус, время,
+    запросы к базе и обращения к кэшу из замеров ServerTimingMiddleware,
+    поэтому стоит сразу после него.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        match = request.resolver_match
+        view = (('view', match.view_name if match else ''),)
+        method = request.method
+        metrics.inc('yatube_http_requests_total', view + (
+            ('method', method if method in METHODS else 'other'),
+            ('status', str(response.status_code)),
+        ))
+        metrics.observe('yatube_http_request_duration_seconds', view, elapsed)
+        timings = timing.current()
+        if timings is not None:
+            counts = timings.counts
+            metrics.inc(
+                'yatube_db_queries_total', view, counts.get('sql', 0)
+            )
+            metrics.inc(
+                'yatube_db_query_seconds_total', view,
+                timings.durations['sql'],
+            )
+            metrics.inc(
+                'yatube_cache_hits_total', view, counts.get('cache_hits', 0)
+            )
+            metrics.inc(
+                'yatube_cache_misses_total', view,
+                counts.get('cache_misses', 0),
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Выполняет представление под профилировщиком, если запрос просит
+    профиль (см. core.profiling). Стоит последним, чтобы process_view
+    остальных middleware, включая CSRF, отработали до представления.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = profiling.requested_mode(request)
+        if mode is None:
+            return None
+        return profiling.run(
+            request, mode, view_func, view_args, view_kwargs
+        )
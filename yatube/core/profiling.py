@@ -0,0 +1,195 @@
+"""
+Профилирование отдельных запросов по требованию.
+
+Профиль снимается, если запрос несёт заголовок X-Profile с токеном
+из manage.py profile_token или если staff добавил к адресу ?_profile=1.
+Токен выписывается на один путь, действует PROFILE_TOKEN_MAX_AGE
+секунд и принимается один раз.
+Представление выполняется под cProfile, а в режиме memory
+(?_profile=memory или токен с --memory) ещё и под tracemalloc.
+Результат сохраняется в PROFILE_DIR: .prof для pstats, .alloc со
+снимком tracemalloc и .json с описанием запроса. Хранятся последние
+PROFILE_KEEP профилей.
+"""
+import cProfile
+import datetime as dt
+import json
+import os
+import pstats
+import re
+import secrets
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+SALT = 'core.profiling'
+MODES = ('cpu', 'memory')
+# Сколько кадров стека хранит tracemalloc для каждого выделения.
+TRACE_FRAMES = 10
+ID = re.compile(r'[\w-]+')
+# tracemalloc общий на процесс: память снимает один запрос за раз.
+_memory_lock = threading.Lock()
+
+
+def make_token(path, mode='cpu'):
+    """Одноразовый токен профиля запроса к path."""
+    # Случайная часть различает токены, выписанные в одну секунду.
+    value = f'{mode}:{secrets.token_hex(8)}:{path}'
+    return signing.TimestampSigner(salt=SALT).sign(value)
+
+
+def requested_mode(request):
+    """'cpu', 'memory' или None, если профиль не запрошен."""
+    token = request.META.get('HTTP_X_PROFILE')
+    if token:
+        max_age = settings.PROFILE_TOKEN_MAX_AGE
+        try:
+            value = signing.TimestampSigner(salt=SALT).unsign(
+                token, max_age=max_age
+            )
+        except signing.BadSignature:
+            return None
+        mode, _, path = value.split(':', 2)
+        if mode not in MODES or path != request.path:
+            return None
+        # Повтор того же токена не снимает второй профиль.
+        signature = token.rsplit(':', 1)[-1]
+        if not cache.add(f'profile-token:{signature}', True, max_age):
+            return None
+        return mode
+    flag = request.GET.get('_profile')
+    if flag and request.user.is_staff:
+        return 'memory' if flag == 'memory' else 'cpu'
+    return None
+
+
+def run(request, mode, view_func, view_args, view_kwargs):
+    """Выполняет представление под профилировщиком и сохраняет профиль."""
+    memory = mode == 'memory' and _memory_lock.acquire(blocking=False)
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        if memory:
+            tracemalloc.start(TRACE_FRAMES)
+        profiler.enable()
+        try:
+            response = view_func(request, *view_args, **view_kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot() if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+            _memory_lock.release()
+    profile_id = save(request, profiler, snapshot, {
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        'status': response.status_code,
+        'mode': 'memory' if memory else 'cpu',
+    })
+    response['X-Profile-Id'] = profile_id
+    return response
+
+
+def save(request, profiler, snapshot, info):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    match = request.resolver_match
+    view = match.view_name if match else ''
+    user = ''
+    if request.user.is_authenticated:
+        user = request.user.get_username()
+    stamp = dt.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    profile_id = '-'.join(
+        re.sub(r'\W', '_', part) for part in (stamp, view, user) if part
+    )
+    base = os.path.join(settings.PROFILE_DIR, profile_id)
+    profiler.dump_stats(base + '.prof')
+    if snapshot is not None:
+        snapshot.dump(base + '.alloc')
+    with open(base + '.json', 'w') as file:
+        json.dump({
+            'id': profile_id,
+            'view': view,
+            'user': user,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'created': stamp,
+            **info,
+        }, file)
+    rotate()
+    return profile_id
+
+
+def rotate():
+    """Удаляет все профили, кроме PROFILE_KEEP последних."""
+    for profile in profiles()[settings.PROFILE_KEEP:]:
+        for extension in ('.json', '.prof', '.alloc'):
+            try:
+                os.remove(path(profile['id'], extension))
+            except FileNotFoundError:
+                pass
+
+
+def path(profile_id, extension):
+    """Путь к файлу профиля или None, если id некорректен."""
+    if not ID.fullmatch(profile_id):
+        return None
+    return os.path.join(settings.PROFILE_DIR, profile_id + extension)
+
+
+def profiles():
+    """Описания сохранённых профилей, новые первыми."""
+    try:
+        names = os.listdir(settings.PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    result = []
+    for name in sorted(names, reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(settings.PROFILE_DIR, name)) as file:
+                profile = json.load(file)
+        except (OSError, ValueError):
+            continue
+        profile['memory'] = os.path.exists(path(profile['id'], '.alloc'))
+        result.append(profile)
+    return result
+
+
+def function_times(profile_id):
+    """{функция: (число вызовов, суммарное время)} профиля."""
+    stats = pstats.Stats(path(profile_id, '.prof'))
+    return {
+        pstats.func_std_string(func): (calls, cumulative)
+        for func, (_, calls, _, cumulative, _) in stats.stats.items()
+    }
+
+
+def diff(old_id, new_id, limit=40):
+    """Текст: функции и строки с наибольшей разницей между профилями."""
+    old, new = function_times(old_id), function_times(new_id)
+    rows = []
+    for func in old.keys() | new.keys():
+        old_calls, old_time = old.get(func, (0, 0.0))
+        new_calls, new_time = new.get(func, (0, 0.0))
+        rows.append((new_time - old_time, old_calls, new_calls, func))
+    rows.sort(key=lambda row: abs(row[0]), reverse=True)
+    lines = [f'{old_id} -> {new_id}', '', 'разница, мс   вызовы   функция']
+    for delta, old_calls, new_calls, func in rows[:limit]:
+        lines.append(
+            f'{delta * 1000:+10.1f}   {old_calls} -> {new_calls}   {func}'
+        )
+    old_alloc, new_alloc = path(old_id, '.alloc'), path(new_id, '.alloc')
+    if os.path.exists(old_alloc) and os.path.exists(new_alloc):
+        lines += ['', 'Память по строкам кода:']
+        stats = tracemalloc.Snapshot.load(new_alloc).compare_to(
+            tracemalloc.Snapshot.load(old_alloc), 'lineno'
+        )
+        lines += [str(stat) for stat in stats[:limit]]
+    return '\n'.join(lines) + '\n'
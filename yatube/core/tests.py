@@ -0,0 +1,374 @@
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from . import background, metrics, profiling, timing
+from .cache_backends.sqlite import SQLiteCache
+
+
+def create_cache(directory, **options):
+    return SQLiteCache(
+        os.path.join(directory, 'cache.sqlite3'), {'OPTIONS': options}
+    )
+
+
+def increment(directory, times):
+    cache = create_cache(directory)
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = create_cache(self.directory)
+
+    def test_get_set(self):
+        """Значения читаются, в том числе None и через get_many"""
+        self.cache.set('a', {'posts': [1, 2]})
+        self.cache.set('b', None)
+        self.assertEqual(self.cache.get('a'), {'posts': [1, 2]})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']),
+            {'a': {'posts': [1, 2]}, 'b': None},
+        )
+        self.assertFalse(self.cache.add('a', 'other'))
+        self.assertTrue(self.cache.add('c', 'new'))
+        self.cache.delete_many(['a', 'c'])
+        self.assertEqual(self.cache.get_many(['a', 'c']), {})
+
+    def test_ttl(self):
+        """Запись пропадает по истечении таймаута"""
+        now = 1_000_000.0
+        with mock.patch('time.time', return_value=now):
+            self.cache.set('key', 'value', 10)
+            self.cache.set('forever', 'value', None)
+        with mock.patch('time.time', return_value=now + 11):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertFalse(self.cache.has_key('key'))
+            self.assertEqual(self.cache.get('forever'), 'value')
+            with self.assertRaises(ValueError):
+                self.cache.incr('key')
+
+    def test_shared_between_instances(self):
+        """Второй экземпляр на том же файле видит записи первого"""
+        self.cache.set('key', 'value')
+        self.assertEqual(create_cache(self.directory).get('key'), 'value')
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняются давно не читанные записи"""
+        cache = create_cache(self.directory, MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        for i in range(4):
+            with mock.patch('time.time', return_value=1000.0 + i * 10):
+                cache.set(i, i)
+        with mock.patch('time.time', return_value=1100.0):
+            cache.get(0)
+            cache.set(4, 4)
+            self.assertEqual(cache.get_many(range(5)), {0: 0, 4: 4})
+
+    def test_size_limit(self):
+        """Суммарный размер значений не превышает MAX_SIZE"""
+        cache = create_cache(self.directory, MAX_SIZE=10_000)
+        for i in range(20):
+            cache.set(i, b'x' * 1000)
+        stats = cache._connection.execute(
+            'SELECT entries, size FROM cache_stats'
+        ).fetchone()
+        self.assertLessEqual(stats[1], 10_000)
+        self.assertEqual(len(cache.get_many(range(20))), stats[0])
+        self.assertIsNotNone(cache.get(19))
+
+    def test_incr_is_atomic_across_processes(self):
+        """incr из нескольких процессов не теряет приращений"""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=increment, args=(self.directory, 200))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 800)
+
+
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_header_and_log(self):
+        """Замеры запроса уходят в Server-Timing и в лог с именем view"""
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            self.client.get(reverse('posts:index'))
+            response = self.client.get(reverse('posts:index'))
+        metrics = {
+            part.split(';')[0] for part in
+            response['Server-Timing'].split(', ')
+        }
+        self.assertTrue({'sql', 'cache', 'total'} <= metrics)
+        first, second = (
+            json.loads(record.getMessage()) for record in logs.records
+        )
+        self.assertEqual(second['view'], 'posts:index')
+        self.assertGreater(first['tpl_ms'], 0)
+        self.assertGreater(first['cache_misses'], 0)
+        self.assertGreater(second['cache_hits'], 0)
+        self.assertIsNone(timing.current())
+
+    def test_nested_templates_counted_once(self):
+        timings = timing.start()
+        self.addCleanup(timing.stop)
+        with timing.measure_template():
+            with timing.measure_template():
+                pass
+        self.assertEqual(timings.counts['tpl'], 1)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.settings_override = override_settings(
+            METRICS_DB=os.path.join(directory, 'metrics.sqlite3'),
+            METRICS_TOKEN='secret',
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_access(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(
+            self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong')
+            .status_code, 403
+        )
+        self.assertEqual(
+            self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+            .status_code, 200
+        )
+        staff = get_user_model().objects.create(
+            username='metrics_staff', is_staff=True
+        )
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_view_metrics(self):
+        self.client.get(reverse('posts:index'))
+        text = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        ).content.decode()
+        labels = 'view="posts:index",method="GET",status="200"'
+        self.assertIn(f'yatube_http_requests_total{{{labels}}}', text)
+        self.assertIn(
+            'yatube_http_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"}', text
+        )
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', text)
+        self.assertIn('yatube_cache_misses_total{view="posts:index"}', text)
+        self.assertIn('yatube_thumbnail_queue_depth 0', text)
+
+    def test_unknown_method_is_other(self):
+        self.client.generic('FOO', reverse('posts:index'))
+        text = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        ).content.decode()
+        self.assertNotIn('method="FOO"', text)
+        self.assertIn('method="other"', text)
+
+    def test_writes_take_no_locks(self):
+        """Запрос пишет метрики, не беря блокировок"""
+        metrics.inc('yatube_test_total', ())
+        lock_types = (type(threading.Lock()), type(threading.RLock()))
+        calls = []
+
+        def profile(frame, event, arg):
+            if event == 'c_call' and isinstance(
+                getattr(arg, '__self__', None), lock_types
+            ):
+                calls.append(arg)
+
+        sys.setprofile(profile)
+        try:
+            metrics.inc('yatube_test_total', ())
+            metrics.observe('yatube_test_seconds', (), 0.01)
+        finally:
+            sys.setprofile(None)
+        self.assertEqual(calls, [])
+
+    def test_finished_threads_are_retired(self):
+        """Метрики завершившихся потоков остаются, их словари - нет"""
+        name = 'yatube_test_threads_total'
+        for _ in range(200):
+            thread = threading.Thread(target=metrics.inc, args=(name, ()))
+            thread.start()
+            thread.join()
+        self.assertLess(len(metrics._shards), 10)
+        counters = {
+            (counter, tuple(labels)): value
+            for counter, labels, value in metrics.snapshot()['counters']
+        }
+        self.assertEqual(counters[name, ()], 200)
+
+    def test_workers_are_summed(self):
+        """Счётчики суммируются по всем снимкам, датчики - по живым"""
+        labels = [['view', 'posts:index']]
+        histogram = [1] + [0] * len(metrics.BUCKETS) + [0.002, 1]
+        snapshot = json.dumps({
+            'counters': [['yatube_db_queries_total', labels, 3]],
+            'histograms': [
+                ['yatube_http_request_duration_seconds', labels, histogram]
+            ],
+            'gauges': {'yatube_thumbnail_queue_depth': 2},
+        })
+        now = time.time()
+        connection = sqlite3.connect(metrics.settings.METRICS_DB)
+        connection.execute(metrics.SCHEMA)
+        connection.executemany(
+            'INSERT INTO snapshots VALUES (?, ?, ?)',
+            [('live', snapshot, now), ('finished', snapshot, now - 3600)],
+        )
+        connection.commit()
+        connection.close()
+        counters, histograms, gauges = metrics.collect()
+        key = (('view', 'posts:index'),)
+        self.assertEqual(counters['yatube_db_queries_total', key], 6)
+        self.assertEqual(
+            histograms['yatube_http_request_duration_seconds', key][0], 2
+        )
+        self.assertEqual(gauges['yatube_thumbnail_queue_depth'], 2)
+        self.assertEqual(gauges['yatube_workers'], 1)
+
+
+class BackgroundPoolTest(SimpleTestCase):
+    def test_queue(self):
+        """Ключ ставится в пул один раз и только после start_workers"""
+        calls = []
+        release = threading.Event()
+
+        def task(key):
+            calls.append(key)
+            release.wait(5)
+
+        pool = background.Pool('test', task, 'Задача %s не выполнена')
+        pool.queue(1)
+        self.assertEqual(pool.depth(), 0)
+        on_commit = mock.patch.object(
+            background.transaction, 'on_commit', lambda func: func()
+        )
+        with mock.patch.object(background, 'workers_started', True):
+            with on_commit:
+                pool.queue(1)
+                pool.queue(1)
+            self.assertEqual(pool.depth(), 1)
+        release.set()
+        pool.get_executor().shutdown()
+        self.assertEqual(calls, [1])
+        self.assertEqual(pool.depth(), 0)
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.settings_override = override_settings(
+            PROFILING_ENABLED=True, PROFILE_DIR=self.directory,
+            PROFILE_KEEP=2,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.staff = get_user_model().objects.create(
+            username='profiling_staff', is_staff=True
+        )
+
+    def test_not_requested(self):
+        """Без токена и флага staff профиль не снимается"""
+        url = reverse('posts:index')
+        for response in (
+            self.client.get(url),
+            self.client.get(url, {'_profile': '1'}),
+            self.client.get(url, HTTP_X_PROFILE='cpu:forged'),
+        ):
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_signed_header_and_rotation(self):
+        url = reverse('posts:index')
+        ids = [
+            self.client.get(
+                url, HTTP_X_PROFILE=profiling.make_token(url, mode)
+            )['X-Profile-Id']
+            for mode in ('cpu', 'memory', 'memory')
+        ]
+        self.assertEqual(
+            [profile['id'] for profile in profiling.profiles()],
+            ids[:0:-1],
+        )
+        self.assertEqual(profiling.profiles()[0]['view'], 'posts:index')
+        self.assertTrue(profiling.profiles()[0]['memory'])
+        self.assertEqual(len(os.listdir(self.directory)), 6)
+
+    def test_token_is_bound_and_single_use(self):
+        url = reverse('posts:index')
+        token = profiling.make_token(url)
+        response = self.client.get(
+            reverse('posts:search'), HTTP_X_PROFILE=token
+        )
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertIn(
+            'X-Profile-Id', self.client.get(url, HTTP_X_PROFILE=token)
+        )
+        self.assertNotIn(
+            'X-Profile-Id', self.client.get(url, HTTP_X_PROFILE=token)
+        )
+        with override_settings(PROFILE_TOKEN_MAX_AGE=-1):
+            response = self.client.get(
+                url, HTTP_X_PROFILE=profiling.make_token(url)
+            )
+        self.assertNotIn('X-Profile-Id', response)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        url = reverse('posts:index')
+        response = self.client.get(
+            url, HTTP_X_PROFILE=profiling.make_token(url)
+        )
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_staff_views(self):
+        self.client.force_login(self.staff)
+        url = reverse('posts:index')
+        old, new = (
+            self.client.get(url, {'_profile': 'memory'})['X-Profile-Id']
+            for _ in range(2)
+        )
+        response = self.client.get(reverse('core:profile_list'))
+        self.assertContains(response, 'posts:index')
+        response = self.client.get(
+            reverse('core:profile_download', args=(old, 'alloc'))
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('core:profile_diff'), {'old': old, 'new': new}
+        )
+        self.assertContains(response, f'{old} -> {new}')
+        self.assertContains(response, 'Память по строкам кода')
+        response = self.client.get(
+            reverse('core:profile_diff'), {'old': '..', 'new': new}
+        )
+        self.assertEqual(response.status_code, 404)
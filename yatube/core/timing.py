@@ -0,0 +1,116 @@
+"""
+Замеры времени внутри одного запроса.
+
+ServerTimingMiddleware открывает замеры на время запроса, а SQL,
+шаблоны, кэш и миниатюры добавляют в них время и счётчики через
+measure, record и count. Вне запроса (команды, фоновые потоки)
+замеров нет, и эти функции почти ничего не стоят.
+"""
+import time
+from contextlib import contextmanager
+from threading import local
+
+_state = local()
+
+# Метрики в порядке заголовка Server-Timing: запросы к базе,
+# рендеринг шаблонов, чтения кэша и поиск миниатюр.
+METRICS = ('sql', 'tpl', 'cache', 'thumb')
+
+
+class Timings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = dict.fromkeys(METRICS, 0.0)
+        self.counts = {}
+        # Вложенные шаблоны уже входят во время внешнего.
+        self.template_depth = 0
+
+    def add(self, metric, elapsed):
+        self.durations[metric] += elapsed
+        self.counts[metric] = self.counts.get(metric, 0) + 1
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def header(self):
+        """Значение заголовка Server-Timing, длительности в мс."""
+        parts = []
+        for metric, elapsed in self.durations.items():
+            count = self.counts.get(metric, 0)
+            if count:
+                parts.append(
+                    f'{metric};dur={elapsed * 1000:.1f};desc="{count}"'
+                )
+        parts.append(f'total;dur={self.total() * 1000:.1f}')
+        return ', '.join(parts)
+
+    def as_dict(self):
+        data = {'total_ms': round(self.total() * 1000, 1)}
+        for metric, elapsed in self.durations.items():
+            data[f'{metric}_ms'] = round(elapsed * 1000, 1)
+            data[f'{metric}_count'] = self.counts.get(metric, 0)
+        for name in ('cache_hits', 'cache_misses'):
+            data[name] = self.counts.get(name, 0)
+        return data
+
+
+def start():
+    _state.timings = Timings()
+    return _state.timings
+
+
+def stop():
+    _state.timings = None
+
+
+def current():
+    """Замеры текущего запроса или None."""
+    return getattr(_state, 'timings', None)
+
+
+def record(metric, elapsed):
+    timings = current()
+    if timings is not None:
+        timings.add(metric, elapsed)
+
+
+def count(name, value=1):
+    timings = current()
+    if timings is not None:
+        timings.counts[name] = timings.counts.get(name, 0) + value
+
+
+@contextmanager
+def measure(metric):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(metric, time.perf_counter() - start_time)
+
+
+def sql(execute, sql, params, many, context):
+    """Обёртка connection.execute_wrapper для замера запросов."""
+    # Без contextmanager: обёртка стоит на каждом запросе к базе.
+    start_time = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record('sql', time.perf_counter() - start_time)
+
+
+@contextmanager
+def measure_template():
+    """Замер рендеринга шаблона без двойного счёта вложенных."""
+    timings = current()
+    if timings is None:
+        yield
+        return
+    timings.template_depth += 1
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.template_depth -= 1
+        if not timings.template_depth:
+            timings.add('tpl', time.perf_counter() - start_time)
@@ -0,0 +1,15 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('', views.profile_list, name='profile_list'),
+    path('diff/', views.profile_diff, name='profile_diff'),
+    path(
+        '<str:profile_id>.<str:extension>',
+        views.profile_download,
+        name='profile_download'
+    ),
+]
@@ -1,5 +1,16 @@
+import hmac
+import os
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseForbidden,
+)
 from django.shortcuts import render
 
+from . import metrics as site_metrics
+from . import profiling
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию,
@@ -17,3 +28,56 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """
+    Метрики всех воркеров для Prometheus. Доступны staff и сборщику
+    с заголовком Authorization: Bearer METRICS_TOKEN.
+    """
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    authorized = bool(token) and hmac.compare_digest(
+        header.encode(), f'Bearer {token}'.encode()
+    )
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden()
+    # Свежий снимок своего процесса, остальные воркеры пишут сами.
+    site_metrics.flush()
+    return HttpResponse(
+        site_metrics.exposition(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@staff_member_required
+def profile_list(request):
+    return render(request, 'core/profiles.html', {
+        'profiles': profiling.profiles(),
+    })
+
+
+@staff_member_required
+def profile_download(request, profile_id, extension):
+    if extension not in ('prof', 'alloc'):
+        raise Http404
+    path = profiling.path(profile_id, f'.{extension}')
+    if path is None or not os.path.exists(path):
+        raise Http404
+    return FileResponse(
+        open(path, 'rb'), as_attachment=True,
+        filename=os.path.basename(path),
+    )
+
+
+@staff_member_required
+def profile_diff(request):
+    """Разница двух профилей: ?old=<id>&new=<id>."""
+    ids = [request.GET.get('old', ''), request.GET.get('new', '')]
+    for profile_id in ids:
+        path = profiling.path(profile_id, '.prof')
+        if path is None or not os.path.exists(path):
+            raise Http404
+    return HttpResponse(
+        profiling.diff(*ids), content_type='text/plain; charset=utf-8'
+    )
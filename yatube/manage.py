@@ -5,7 +5,11 @@ import sys
 
 
 def main():
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    settings_module = 'yatube.settings'
+    if sys.argv[1:2] == ['test']:
+        # Тесты не трогают кэш, метрики и медиа сайта.
+        settings_module = 'yatube.test_settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
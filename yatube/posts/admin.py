@@ -1,5 +1,144 @@
+import datetime as dt
+
+from django import forms
 from django.contrib import admin
-from .models import Post, Group, Comment, Follow
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db.models import Max, Min
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import search
+from .models import Post, PostQuerySet, Group, Comment, Follow
+
+# Сколько строк changelist считает точно; дальше число оценивается.
+COUNT_LIMIT = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Паджинатор changelist без COUNT(*) по всей таблице.
+
+    Строки считаются не дальше COUNT_LIMIT. Если их больше, для списка
+    без фильтров число оценивается по наибольшему id, а для
+    отфильтрованного остаётся COUNT_LIMIT: дальше сужают фильтры
+    и иерархия дат.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        count = queryset[:COUNT_LIMIT + 1].count()
+        if count <= COUNT_LIMIT:
+            return count
+        if queryset.query.where:
+            return COUNT_LIMIT
+        return max(queryset.aggregate(last=Max('pk'))['last'], count)
+
+
+def period_end(start, kind):
+    if kind == 'year':
+        return start.replace(year=start.year + 1)
+    if kind == 'month':
+        return (start + dt.timedelta(days=31)).replace(day=1)
+    return start + dt.timedelta(days=1)
+
+
+class ChangeListQuerySet(PostQuerySet):
+    """
+    Посты changelist. Иерархия дат строит ссылки через dates(), а это
+    DISTINCT по дате каждой строки. Здесь dates() берёт границы из
+    индекса и проверяет каждый год, месяц или день одним exists().
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # SQLite читает MIN и MAX из индекса, только если такая функция
+        # в запросе одна, а иерархия дат просит обе сразу.
+        if args or len(kwargs) < 2 or not all(
+            isinstance(value, (Min, Max)) for value in kwargs.values()
+        ):
+            return super().aggregate(*args, **kwargs)
+        result = {}
+        for name, value in kwargs.items():
+            result.update(super().aggregate(**{name: value}))
+        return result
+
+    def dates(self, field_name, kind, order='ASC'):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        first = timezone.localtime(bounds['first']).date()
+        last = timezone.localtime(bounds['last']).date()
+        start = first.replace(
+            month=1 if kind == 'year' else first.month,
+            day=first.day if kind == 'day' else 1,
+        )
+        dates = []
+        while start <= last:
+            end = period_end(start, kind)
+            # Границы BETWEEN SQLite берёт в индекс даже рядом с
+            # фильтром changelist по тому же полю, а >= и < - нет.
+            if self.filter(**{f'{field_name}__range': (
+                self.start_of(start),
+                self.start_of(end) - dt.timedelta(microseconds=1),
+            )}).exists():
+                dates.append(start)
+            start = end
+        return dates[::-1] if order == 'DESC' else dates
+
+    @staticmethod
+    def start_of(day):
+        return timezone.make_aware(dt.datetime.combine(day, dt.time()))
+
+
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    """
+    Автокомплит, которому можно передать уже прочитанные выбранные
+    объекты. Иначе каждая строка changelist читает свой вариант
+    отдельным запросом.
+    """
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        values = {
+            str(v) for v in value
+            if str(v) not in self.choices.field.empty_values
+        }
+        if self.selected is None or values - {
+            str(obj.pk) for obj in self.selected
+        }:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for obj in self.selected:
+            label = self.choices.field.label_from_instance(obj)
+            options.append(self.create_option(
+                name, obj.pk, label, str(obj.pk) in values, len(options)
+            ))
+        return [(None, options, 0)]
+
+
+class PostChangeListForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        field = self.fields.get('group')
+        if field is not None:
+            widget = getattr(field.widget, 'widget', field.widget)
+            # Группа уже прочитана вместе с постом через list_select_related.
+            widget.selected = (
+                [self.instance.group] if self.instance.group_id else []
+            )
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = (
+        'title',
+        'slug',
+        'posts_count',
+    )
+    search_fields = ('title', 'slug')
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -13,8 +152,41 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
+    date_hierarchy = 'pub_date'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return ChangeListQuerySet(
+            self.model, query=queryset.query, using=queryset.db
+        )
+
+    def get_changelist_form(self, request, **kwargs):
+        return super().get_changelist_form(
+            request, form=PostChangeListForm, **kwargs
+        )
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs.setdefault('widget', LoadedAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'),
+            ))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по индексу FTS5 вместо LIKE '%слово%' по всей таблице."""
+        if not search.match_expression(search_term):
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        ids = RawSQL(*search.matching_ids_sql(search_term))
+        return queryset.filter(pk__in=ids), False
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = (
@@ -23,7 +195,13 @@ class CommentAdmin(admin.ModelAdmin):
         'post',
         'created',
     )
-    search_fields = ('author', 'text')
+    # Поиск по автору - точное имя пользователя, по уникальному индексу.
+    search_fields = ('=author__username', 'text')
+    list_select_related = ('author', 'post')
+    autocomplete_fields = ('author',)
+    raw_id_fields = ('post',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class FollowAdmin(admin.ModelAdmin):
@@ -31,9 +209,13 @@ class FollowAdmin(admin.ModelAdmin):
         'user',
         'author'
     )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
@@ -3,3 +3,17 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from core import metrics
+
+        from . import search, signals, thumbnails  # noqa: F401
+
+        post_migrate.connect(search.install_triggers, sender=self)
+        metrics.gauge(
+            'yatube_thumbnail_queue_depth',
+            'Посты в очереди на построение миниатюр.',
+            thumbnails.queue_depth,
+        )
@@ -0,0 +1,45 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import thumbnails
+
+
+def card_key(template_name, post):
+    """
+    Ключ карточки: шаблон, id поста, время его изменения и подписи
+    автора и группы, которые меняются без правки поста.
+    """
+    stamp = int(post.updated.timestamp() * 1000000)
+    author = post.author
+    labels = (
+        f'{author.get_username()}:{author.get_full_name()}:'
+        f'{post.group.slug if post.group_id else ""}'
+    )
+    digest = hashlib.md5(labels.encode()).hexdigest()[:12]
+    return f'post_card:{template_name}:{post.pk}:{stamp}:{digest}'
+
+
+def render_cards(posts, template_name):
+    """
+    HTML карточек постов в порядке posts.
+
+    Все карточки читаются из кэша одним get_many, а недостающие
+    рендерятся и записываются одним set_many. Записи миниатюр
+    для них загружаются заранее одним запросом.
+    """
+    keys = {card_key(template_name, post): post for post in posts}
+    cards = cache.get_many(keys)
+    missing = [key for key in keys if key not in cards]
+    thumbnails.preload(keys[key].image for key in missing)
+    missing = {
+        key: render_to_string(template_name, {'post': keys[key]})
+        for key in missing
+    }
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,121 @@
+"""
+Условные GET для лент и страницы поста.
+
+Last-Modified ленты - позднее из индексного максимума updated её
+постов и времени последнего сдвига версий её областей page_cache:
+так дата учитывает и удалённые посты. У страницы поста это время
+правки поста и его последнего комментария. ETag собран из версий
+page_cache, которые сдвигают сигналы, и id пользователя, для
+которого отрисована страница.
+"""
+from functools import wraps
+
+from django.db.models import Max, OuterRef, Subquery
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from . import page_cache
+from .models import Comment, Post
+from .page_cache import get_versions, user_scope
+
+
+def etag(request, *scopes):
+    scopes = [*scopes, user_scope(request)]
+    versions = get_versions([scope for scope in scopes if scope])
+    return f'W/"{versions}-{request.user.pk}"'
+
+
+def last_modified(request, posts, scope):
+    dates = (
+        posts.aggregate(last=Max('updated'))['last'],
+        page_cache.last_modified(
+            [scope for scope in (scope, user_scope(request)) if scope]
+        ),
+    )
+    return max(filter(None, dates), default=None)
+
+
+def index_etag(request):
+    return etag(request, 'global')
+
+
+def index_last_modified(request):
+    return last_modified(request, Post.objects.all(), 'global')
+
+
+def group_etag(request, slug):
+    return etag(request, f'group:{slug}')
+
+
+def group_last_modified(request, slug):
+    return last_modified(
+        request, Post.objects.filter(group__slug=slug), f'group:{slug}'
+    )
+
+
+def profile_etag(request, username):
+    return etag(request, f'author:{username}')
+
+
+def profile_last_modified(request, username):
+    return last_modified(
+        request,
+        Post.objects.filter(author__username=username),
+        f'author:{username}',
+    )
+
+
+def post_state(request, post_id):
+    """(updated, последний комментарий, автор, группа) поста одним запросом."""
+    if not hasattr(request, '_post_state'):
+        last_comment = Comment.objects.filter(
+            post=OuterRef('pk')
+        ).order_by('-created').values('created')[:1]
+        request._post_state = Post.objects.filter(pk=post_id).annotate(
+            last_comment=Subquery(last_comment)
+        ).values_list(
+            'updated', 'last_comment', 'author__username', 'group__slug'
+        ).first()
+    return request._post_state
+
+
+def post_etag(request, post_id):
+    state = post_state(request, post_id)
+    if state is None:
+        return None
+    _, _, username, slug = state
+    return etag(
+        request,
+        f'post:{post_id}',
+        f'author:{username}',
+        f'group:{slug}' if slug else None,
+    )
+
+
+def post_last_modified(request, post_id):
+    state = post_state(request, post_id)
+    if state is None:
+        return None
+    updated, last_comment, _, _ = state
+    return max(filter(None, (updated, last_comment)))
+
+
+def conditional(etag_func, last_modified_func):
+    """
+    condition() с Cache-Control: no-cache, max-age=0.
+
+    Браузер сверяется с сервером перед каждым показом и получает 304,
+    если валидаторы не изменились. Expires, который ставит вложенный
+    cache_page, убирается: он противоречил бы max-age=0.
+    """
+    def decorator(view):
+        view = condition(etag_func, last_modified_func)(view)
+        view = cache_control(no_cache=True, max_age=0)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            del response['Expires']
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,69 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field, outer='pk'):
+    """Подзапрос с числом строк model, ссылающихся на внешнюю строку."""
+    rows = (
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def reconcile_counters(apps=global_apps):
+    """
+    Пересчитывает денормализованные счётчики по фактическим данным.
+
+    Возвращает словарь с числом исправленных строк для каждого счётчика.
+    Принимает реестр apps, чтобы работать и из миграций.
+    """
+    Post = apps.get_model('posts', 'Post')
+    Group = apps.get_model('posts', 'Group')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+
+    authors_without_stats = set()
+    for model in (Post, Follow):
+        authors_without_stats.update(
+            model.objects.filter(author__stats__isnull=True)
+            .order_by()
+            .values_list('author_id', flat=True)
+            .distinct()
+        )
+    AuthorStats.objects.bulk_create(
+        AuthorStats(author_id=author_id)
+        for author_id in authors_without_stats
+    )
+    targets = {
+        'group.posts_count': (
+            Group.objects, 'posts_count', count_subquery(Post, 'group')
+        ),
+        'post.comments_count': (
+            Post.objects, 'comments_count', count_subquery(Comment, 'post')
+        ),
+        'author.posts_count': (
+            AuthorStats.objects,
+            'posts_count',
+            count_subquery(Post, 'author', outer='author'),
+        ),
+        'author.followers_count': (
+            AuthorStats.objects,
+            'followers_count',
+            count_subquery(Follow, 'author', outer='author'),
+        ),
+    }
+    fixed = {}
+    for name, (queryset, field, actual) in targets.items():
+        drifted = queryset.annotate(actual=actual).filter(
+            ~Q(**{field: F('actual')})
+        )
+        fixed[name] = drifted.count()
+        if fixed[name]:
+            queryset.update(**{field: actual})
+    return fixed
@@ -1,6 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.translation import gettext_lazy as _
 
+from .images import DECODE_ERRORS, normalize_upload
 from .models import Post, Comment
 
 
@@ -16,6 +18,22 @@ class PostForm(forms.ModelForm):
             'text': _('Это поле обязательно.')
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            try:
+                return normalize_upload(image)
+            except DECODE_ERRORS:
+                raise forms.ValidationError(
+                    self.fields['image'].error_messages['invalid_image'],
+                    code='invalid_image',
+                )
+        if image:
+            # Прежняя картинка: None не трогает поле, и ImageField
+            # не перечитывает размеры из файла.
+            return None
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,132 @@
+"""
+Нормализация картинок постов при загрузке.
+
+Картинка поворачивается по EXIF, теряет метаданные, уменьшается
+до IMAGE_MAX_SIDE по длинной стороне и пережимается. Исходник
+остаётся, если поворачивать, уменьшать и вычищать было нечего,
+а пережатие почти ничего не даёт. Анимированные картинки
+не трогаются.
+"""
+import math
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.images import get_image_dimensions
+from django.db import transaction
+from PIL import Image, ImageOps
+
+# Форматы, которые сохраняются как есть; остальное пережимается в JPEG.
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+# Ключи Image.info с метаданными, которые не должны попасть на сайт.
+METADATA = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+ORIENTATION = 0x0112
+# Доля исходного размера, меньше которой должно получиться пережатие.
+MIN_SAVINGS = 0.9
+# Что бросает PIL на обрезанных, битых и слишком больших картинках:
+# проверку ImageField они проходят, а падают только при декодировании.
+DECODE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+
+def save_options(image_format, image):
+    options = {'icc_profile': image.info.get('icc_profile')}
+    if image_format == 'JPEG':
+        options.update(
+            quality=settings.IMAGE_JPEG_QUALITY,
+            optimize=True,
+            progressive=True,
+        )
+    elif image_format == 'WEBP':
+        options.update(quality=settings.IMAGE_JPEG_QUALITY, method=6)
+    else:
+        options.update(optimize=True)
+    return options
+
+
+def normalize(data):
+    """
+    (байты, расширение) нормализованной картинки или None,
+    если исходные байты лучше оставить.
+    """
+    source = Image.open(BytesIO(data))
+    if getattr(source, 'is_animated', False):
+        return None
+    image_format = source.format if source.format in EXTENSIONS else 'JPEG'
+    has_metadata = any(key in source.info for key in METADATA)
+    rotated = source.getexif().get(ORIENTATION, 1) != 1
+    long_side = max(source.size)
+    max_side = settings.IMAGE_MAX_SIDE
+    scale = max_side / long_side
+    if scale < 1 and source.format == 'JPEG':
+        # Декодер JPEG сам уменьшает в 2-8 раз, это в разы быстрее.
+        source.draft('RGB', tuple(math.ceil(n * scale) for n in source.size))
+    image = ImageOps.exif_transpose(source)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    resized = max(image.size) < long_side
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, image_format, **save_options(image_format, source))
+    result = output.getvalue()
+    # Без поворота и метаданных пережатие ради пары процентов только
+    # копит потери качества при повторной нормализации.
+    if not (rotated or resized or has_metadata) and (
+        len(result) > len(data) * MIN_SAVINGS
+    ):
+        return None
+    return result, EXTENSIONS[image_format]
+
+
+def normalize_upload(upload):
+    """Загруженный файл после normalize или он сам."""
+    upload.seek(0)
+    normalized = normalize(upload.read())
+    upload.seek(0)
+    if normalized is None:
+        return upload
+    data, extension = normalized
+    name = os.path.splitext(os.path.basename(upload.name))[0] + extension
+    return ContentFile(data, name=name)
+
+
+def rename_image(old, new):
+    """
+    Переводит посты на новое имя картинки. Сохранение поста сбрасывает
+    кэш страниц и карточек и удаляет миниатюры старого имени.
+    """
+    from .models import Post
+
+    storage = Post._meta.get_field('image').storage
+    with storage.open(new) as content:
+        width, height = get_image_dimensions(content)
+    count = 0
+    with transaction.atomic():
+        posts = Post.objects.filter(image=old).select_for_update()
+        for post in posts.iterator():
+            post.image = new
+            post.image_width, post.image_height = width, height
+            post.save(update_fields=[
+                'image', 'image_width', 'image_height', 'updated',
+            ])
+            count += 1
+    return count
+
+
+def image_names(batch_size, posts=None):
+    """Имена картинок постов по возрастанию, пачками по ключу."""
+    from .models import Post
+
+    if posts is None:
+        posts = Post.objects.all()
+    posts = posts.exclude(image='').order_by('image')
+    last = ''
+    while True:
+        names = list(
+            posts.filter(image__gt=last)
+            .values_list('image', flat=True).distinct()[:batch_size]
+        )
+        yield from names
+        if len(names) < batch_size:
+            return
+        last = names[-1]
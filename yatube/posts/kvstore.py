@@ -0,0 +1,110 @@
+"""
+KV-хранилище sorl-thumbnail с LRU в памяти процесса.
+
+Записи ищутся сначала в LRU, затем в общем кэше и только потом
+в базе. preload загружает записи целой страницы одним get_many
+и одним запросом к базе. В LRU попадают только найденные записи:
+отсутствие миниатюры может измениться в любой момент.
+
+Удаление записей сдвигает поколение в общем кэше, и LRU остальных
+процессов сбрасывается при их следующем preload.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import page_cache
+
+# Область page_cache, версия которой служит поколением записей.
+GENERATION_SCOPE = 'thumbnail_kvstore'
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+
+    def _remember(self, key, value):
+        if value is None or value == cached_db_kvstore.EMPTY_VALUE:
+            return
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+            return value
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _check_generation(self):
+        """Сбрасывает LRU, если другой процесс удалял записи."""
+        generation = page_cache.get_versions([GENERATION_SCOPE])
+        if generation != self._generation:
+            self.clear_lru()
+            self._generation = generation
+
+    def preload(self, image_files):
+        """Загружает записи картинок: один get_many и один запрос к базе."""
+        self._check_generation()
+        keys = [
+            key for key in
+            dict.fromkeys(add_prefix(image.key) for image in image_files)
+            if self._recall(key) is None
+        ]
+        if not keys:
+            return
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            rows = dict(
+                KVStoreModel.objects.filter(key__in=missing)
+                .values_list('key', 'value')
+            )
+            loaded = {
+                key: rows.get(key, cached_db_kvstore.EMPTY_VALUE)
+                for key in missing
+            }
+            self.cache.set_many(loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(loaded)
+        for key, value in found.items():
+            self._remember(key, value)
+
+    def _get_raw(self, key):
+        value = self._recall(key)
+        if value is None:
+            value = super()._get_raw(key)
+            self._remember(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._remember(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._forget(*keys)
+        page_cache.bump(GENERATION_SCOPE)
+
+    def clear_lru(self):
+        with self._lock:
+            self._lru.clear()
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.clear_lru()
@@ -0,0 +1,40 @@
+from django.core.files.images import get_image_dimensions
+from django.core.management.base import BaseCommand
+
+from posts.images import image_names
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет image_width и image_height постов, загруженных '
+        'до появления этих полей. Каждый файл читается один раз.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько имён картинок читать из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        filled = failed = 0
+        for name in image_names(
+            max(options['batch_size'], 1),
+            Post.objects.filter(image_width__isnull=True),
+        ):
+            try:
+                with storage.open(name) as content:
+                    width, height = get_image_dimensions(content)
+            except Exception:
+                width = height = None
+            if width is None:
+                self.stderr.write(f'Не удалось прочитать {name}')
+                failed += 1
+                continue
+            # update() не меняет updated, и кэш карточек остаётся.
+            filled += Post.objects.filter(image=name).update(
+                image_width=width, image_height=height
+            )
+        self.stdout.write(f'Заполнено постов: {filled}, ошибок: {failed}')
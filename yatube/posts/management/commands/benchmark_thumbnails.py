@@ -0,0 +1,128 @@
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+from sorl.thumbnail import default
+from sorl.thumbnail.parsers import parse_geometry
+
+from posts.models import Post
+from posts.thumbnails import CARD_GEOMETRY, CARD_OPTIONS
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'))
+    libc.malloc_trim
+except (OSError, AttributeError):
+    libc = None
+
+ENGINES = (
+    ('sorl', 'sorl.thumbnail.engines.pil_engine.Engine'),
+    ('проект', settings.THUMBNAIL_ENGINE),
+)
+
+
+def memory(field):
+    """Поле /proc/self/status в байтах."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def reset_peak():
+    """Сбрасывает пик RSS процесса; False, если ядро этого не умеет."""
+    # Освобождённая прошлыми замерами память возвращается системе,
+    # иначе следующий замер переиспользует её и не поднимет пик.
+    if libc is not None:
+        libc.malloc_trim(0)
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def create(engine, data, geometry, options):
+    """(время CPU, прирост пика RSS или None) одной миниатюры."""
+    can_measure = reset_peak()
+    rss = memory('VmRSS') if can_measure else 0
+    start = time.process_time()
+    image = engine.get_image(ContentFile(data))
+    ratio = engine.get_image_ratio(image, options)
+    engine.create(image, parse_geometry(geometry, ratio), options)
+    elapsed = time.process_time() - start
+    if not can_measure:
+        return elapsed, None
+    return elapsed, max(memory('VmHWM') - rss, 0)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает движок миниатюр проекта со стандартным движком sorl '
+        'на картинках media/posts: время CPU и пик памяти на миниатюру '
+        '(декодирование и преобразования, без записи файла).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Сколько раз строить каждую миниатюру; берётся минимум.',
+        )
+
+    def handle(self, *args, **options):
+        engines = [
+            (label, import_string(path)()) for label, path in ENGINES
+        ]
+        header = f'{"картинка":<32}{"формат":>8}{"размер":>12}'
+        for label, _ in engines:
+            header += f'{label + ", мс":>14}{label + ", МБ":>14}'
+        self.stdout.write(header)
+        totals = {label: [0.0, 0] for label, _ in engines}
+        thumbnail_options = {
+            **default.backend.default_options, **CARD_OPTIONS
+        }
+        for name, data in self.images():
+            image = engines[0][1].get_image(ContentFile(data))
+            row = (
+                f'{name[:31]:<32}{image.format:>8}'
+                f'{"x".join(map(str, image.size)):>12}'
+            )
+            for label, engine in engines:
+                runs = [
+                    create(engine, data, CARD_GEOMETRY, thumbnail_options)
+                    for _ in range(max(options['repeat'], 1))
+                ]
+                cpu = min(run[0] for run in runs)
+                peaks = [run[1] for run in runs if run[1] is not None]
+                peak = max(peaks) if peaks else 0
+                totals[label][0] += cpu
+                totals[label][1] = max(totals[label][1], peak)
+                row += f'{cpu * 1000:>14.1f}{peak / 2 ** 20:>14.1f}'
+            self.stdout.write(row)
+        total = f'{"итого / максимум":<52}'
+        for label, _ in engines:
+            cpu, peak = totals[label]
+            total += f'{cpu * 1000:>14.1f}{peak / 2 ** 20:>14.1f}'
+        self.stdout.write(total)
+
+    def images(self):
+        """Картинки каталога постов без повторов содержимого."""
+        root = Post._meta.get_field('image').storage.path(
+            Post._meta.get_field('image').upload_to
+        )
+        seen = set()
+        for directory, _, files in sorted(os.walk(root)):
+            for filename in sorted(files):
+                with open(os.path.join(directory, filename), 'rb') as file:
+                    data = file.read()
+                digest = hashlib.sha256(data).digest()
+                if digest not in seen:
+                    seen.add(digest)
+                    yield filename, data
@@ -0,0 +1,79 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import AuthorStats, Follow, Post, TimelineEntry
+from posts.paginators import CursorPaginator
+from posts.timeline import follow_feed
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Откатывает все данные замера."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает push и pull ленты подписок: сколько записей '
+        'порождает один пост и сколько стоит чтение ленты. '
+        'Все созданные данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', type=int, default=2000)
+        parser.add_argument('--posts', type=int, default=20)
+        parser.add_argument('--reads', type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.benchmark(
+                    options['followers'], options['posts'], options['reads']
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def benchmark(self, followers, posts, reads):
+        author = User.objects.create(username='benchmark_author')
+        User.objects.bulk_create(
+            User(username=f'benchmark_follower_{i}') for i in range(followers)
+        )
+        readers = User.objects.filter(username__startswith='benchmark_f')
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author) for reader in readers
+        )
+        AuthorStats.objects.create(author=author, followers_count=followers)
+        reader = readers.first()
+
+        self.stdout.write(
+            f'{"режим":<6}{"подписчиков":>12}{"записей/пост":>14}'
+            f'{"мс/пост":>10}{"мс/чтение":>11}'
+        )
+        for mode in ('push', 'pull'):
+            AuthorStats.objects.filter(author=author).update(
+                pulled=mode == 'pull'
+            )
+            written_before = TimelineEntry.objects.count()
+            start = time.perf_counter()
+            for i in range(posts):
+                Post.objects.create(author=author, text=f'{mode} {i}')
+            write_ms = (time.perf_counter() - start) * 1000 / posts
+            written = TimelineEntry.objects.count() - written_before
+
+            start = time.perf_counter()
+            for _ in range(reads):
+                list(
+                    CursorPaginator(
+                        follow_feed(reader), 10
+                    ).get_cursor_page()
+                )
+            read_ms = (time.perf_counter() - start) * 1000 / reads
+            self.stdout.write(
+                f'{mode:<6}{followers:>12}{written / posts:>14.1f}'
+                f'{write_ms:>10.2f}{read_ms:>11.2f}'
+            )
+            Post.objects.filter(author=author).delete()
@@ -0,0 +1,68 @@
+import os
+import posixpath
+
+from django.core.management.base import BaseCommand
+
+from posts.images import rename_image
+from posts.models import Post
+from posts.storage import content_hash, content_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов из каталога upload_to под имена '
+        'по sha256 содержимого, удаляет дубликаты и переписывает '
+        'Post.image. Повторный запуск безопасен.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать файлы, дубликаты и посты.',
+        )
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        storage = field.storage
+        upload_to = field.upload_to.rstrip('/')
+        dry_run = options['dry_run']
+        moved = duplicates = saved = rewritten = 0
+        # При --dry-run файлы не переносятся, повторы ловит этот набор.
+        seen = set()
+        with os.scandir(storage.path(upload_to)) as entries:
+            # Файлы под именами по хэшу лежат в подкаталогах, их не трогаем.
+            files = sorted(
+                entry.name for entry in entries if entry.is_file()
+            )
+        for filename in files:
+            old = posixpath.join(upload_to, filename)
+            with storage.open(old) as content:
+                new = content_name(old, content_hash(content))
+            duplicate = new in seen or storage.exists(new)
+            seen.add(new)
+            if duplicate:
+                duplicates += 1
+                saved += storage.size(old)
+            else:
+                moved += 1
+            posts = Post.objects.filter(image=old)
+            if dry_run:
+                rewritten += posts.count()
+                continue
+            # Сначала новый файл, потом ссылки, и только потом удаление:
+            # прерванный запуск не оставит пост без картинки.
+            if not duplicate:
+                os.makedirs(os.path.dirname(storage.path(new)), exist_ok=True)
+                os.link(storage.path(old), storage.path(new))
+            rewritten += rename_image(old, new)
+            storage.delete(old)
+        prefix = 'Будет ' if dry_run else ''
+        self.stdout.write(
+            f'{prefix}перенесено файлов: {moved}, удалено дубликатов: '
+            f'{duplicates} ({saved / 2 ** 20:.1f} МБ), '
+            f'переписано постов: {rewritten}'
+        )
+        if rewritten and not dry_run:
+            self.stdout.write(
+                'Миниатюры новых имён строит prewarm_thumbnails.'
+            )
@@ -0,0 +1,245 @@
+"""
+Сборщик мусора в media: картинки постов и миниатюры без ссылок.
+
+Память не зависит от числа файлов: записи каталогов читаются
+потоком, без списка каталога целиком, а ссылки проверяются в базе
+пачками. Три прохода:
+
+1. файлы upload_to, на которые не ссылается ни один пост;
+2. записи KV-хранилища sorl о картинках, на которые не ссылается
+   ни один пост, удаляются вместе с файлами их миниатюр;
+3. файлы каталога миниатюр без записи в KV-хранилище.
+
+Файлы моложе --min-age пропускаются: загруженная картинка лежит
+на диске раньше, чем закоммичен её пост, а повторная загрузка тех же
+байтов обновляет mtime уже лежащего файла. Запись KV не трогается,
+пока свежа её картинка. Перед удалением картинки ссылки на неё
+проверяются ещё раз.
+"""
+import os
+import posixpath
+import shutil
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.models import Post
+
+
+def walk(root, path=''):
+    """Файлы каталога и подкаталогов в порядке чтения с диска."""
+    try:
+        scan = os.scandir(os.path.join(root, path))
+    except FileNotFoundError:
+        return
+    with scan:
+        for entry in scan:
+            name = posixpath.join(path, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(root, name)
+            elif entry.is_file(follow_symlinks=False):
+                yield name, entry
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет или переносит в карантин картинки постов и миниатюры, '
+        'на которые ничто не ссылается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать мусор.',
+        )
+        parser.add_argument(
+            '--quarantine',
+            help='Переносить файлы в этот каталог вместо удаления.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки запросов к базе.',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.quarantine = options['quarantine']
+        self.batch_size = max(options['batch_size'], 1)
+        self.deadline = time.time() - options['min_age']
+        field = Post._meta.get_field('image')
+        self.upload_to = field.upload_to.rstrip('/')
+
+        counts = {
+            'картинок': self.collect_images(field.storage),
+            'записей KV': self.collect_records(),
+            'миниатюр': self.collect_thumbnails(default.storage),
+        }
+        verb = 'Найдено' if self.dry_run else (
+            'Перенесено в карантин' if self.quarantine else 'Удалено'
+        )
+        self.stdout.write(f'{verb}: ' + ', '.join(
+            f'{what} {count} ({size / 2 ** 20:.1f} МБ)'
+            for what, (count, size) in counts.items()
+        ))
+
+    def collect_images(self, storage):
+        """Файлы upload_to без постов, ссылки проверяются пачками."""
+        count = size = 0
+        files = (
+            (posixpath.join(self.upload_to, name), entry)
+            for name, entry in walk(storage.path(self.upload_to))
+        )
+        for batch in batches(files, self.batch_size):
+            referenced = self.referenced(name for name, _ in batch)
+            for name, entry in batch:
+                if name in referenced:
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime > self.deadline or self.referenced([name]):
+                    continue
+                self.dispose(storage, name)
+                count += 1
+                size += stat.st_size
+        return count, size
+
+    def referenced(self, names):
+        """Имена из names, на которые ссылаются посты."""
+        return set(
+            Post.objects.filter(image__in=list(names))
+            .values_list('image', flat=True)
+        )
+
+    def is_fresh(self, image):
+        """Картинка моложе --min-age; пропавший файл свежим не считается."""
+        try:
+            return os.path.getmtime(image.storage.path(image.name)) > (
+                self.deadline
+            )
+        except (FileNotFoundError, NotImplementedError):
+            return False
+
+    def collect_records(self):
+        """Записи sorl о картинках без постов и файлы их миниатюр."""
+        count = size = 0
+        prefix = add_prefix('', 'thumbnails')
+        rows = KVStoreModel.objects.filter(
+            key__startswith=prefix
+        ).order_by('key').values_list('key', 'value')
+        last = ''
+        while True:
+            batch = list(rows.filter(key__gt=last)[:self.batch_size])
+            if not batch:
+                return count, size
+            last = batch[-1][0]
+            thumbnails = {
+                del_prefix(key): deserialize(value) for key, value in batch
+            }
+            sources = self.images(thumbnails)
+            images = {
+                key: image for key, image in sources.items()
+                if image.name.startswith(self.upload_to + '/')
+            }
+            referenced = self.referenced(
+                image.name for image in images.values()
+            )
+            garbage = [
+                key for key in thumbnails
+                if key not in sources or key in images and (
+                    images[key].name not in referenced
+                    and not self.is_fresh(images[key])
+                )
+            ]
+            # Повторная проверка перед удалением: пост мог появиться,
+            # пока проверялась свежесть файлов.
+            referenced = self.referenced(
+                images[key].name for key in garbage if key in images
+            )
+            garbage = [
+                key for key in garbage
+                if key not in images or images[key].name not in referenced
+            ]
+            if not garbage:
+                continue
+            thumbnail_keys = [
+                key for source in garbage for key in thumbnails[source]
+            ]
+            for image in self.images(thumbnail_keys).values():
+                if image.exists():
+                    size += image.storage.size(image.name)
+                    self.dispose(image.storage, image.name)
+            count += len(garbage)
+            if not self.dry_run:
+                default.kvstore._delete_raw(
+                    *(add_prefix(key, 'thumbnails') for key in garbage),
+                    *(add_prefix(key) for key in garbage + thumbnail_keys),
+                )
+
+    def images(self, keys):
+        """ImageFile из записей KV-хранилища по ключам, одним запросом."""
+        rows = KVStoreModel.objects.filter(
+            key__in=[add_prefix(key) for key in keys]
+        ).values_list('key', 'value')
+        return {
+            del_prefix(key): deserialize_image_file(value)
+            for key, value in rows
+        }
+
+    def collect_thumbnails(self, storage):
+        """Файлы миниатюр, о которых не знает KV-хранилище."""
+        count = size = 0
+        prefix = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+        files = (
+            (posixpath.join(prefix, name), entry)
+            for name, entry in walk(storage.path(prefix))
+        )
+        for batch in batches(files, self.batch_size):
+            keys = {
+                add_prefix(ImageFile(name, storage).key): (name, entry)
+                for name, entry in batch
+            }
+            known = set(
+                KVStoreModel.objects.filter(key__in=keys)
+                .values_list('key', flat=True)
+            )
+            for key, (name, entry) in keys.items():
+                if key in known:
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime > self.deadline:
+                    continue
+                self.dispose(storage, name)
+                count += 1
+                size += stat.st_size
+        return count, size
+
+    def dispose(self, storage, name):
+        """Удаляет файл или переносит его в карантин с тем же путём."""
+        if self.dry_run:
+            return
+        if self.quarantine:
+            target = os.path.join(self.quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(storage.path(name), target)
+        else:
+            storage.delete(name)
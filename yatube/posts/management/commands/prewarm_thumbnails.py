@@ -0,0 +1,117 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.dateparse import parse_date
+
+from posts.models import Post
+from posts.thumbnails import build_thumbnails, is_ready
+
+logger = logging.getLogger(__name__)
+
+# Как часто печатать прогресс, в обработанных картинках.
+PROGRESS_EVERY = 100
+
+
+def build(post_id, image, force):
+    """Задача пула: (id поста, удалось ли построить миниатюры)."""
+    try:
+        build_thumbnails(image, force)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', image)
+        return post_id, False
+    return post_id, True
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит миниатюры картинок постов во всех геометриях шаблонов '
+        'в пуле процессов. Готовые миниатюры пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', help='Только посты, опубликованные с даты ГГГГ-ММ-ДД.'
+        )
+        parser.add_argument('--group', help='Только посты группы со slug.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов.',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Построить заново и готовые миниатюры.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, сколько картинок будет обработано.',
+        )
+
+    def get_posts(self, since, group):
+        posts = Post.objects.exclude(image='').order_by('pk')
+        if since:
+            date = parse_date(since)
+            if date is None:
+                raise CommandError(f'Неверная дата --since: {since}')
+            posts = posts.filter(pub_date__date__gte=date)
+        if group:
+            posts = posts.filter(group__slug=group)
+        return posts.values_list('pk', 'image')
+
+    def handle(self, *args, **options):
+        force = options['force']
+        todo = []
+        skipped = 0
+        for post_id, image in self.get_posts(
+            options['since'], options['group']
+        ).iterator():
+            if not force and is_ready(image):
+                skipped += 1
+            else:
+                todo.append((post_id, image))
+        self.stdout.write(
+            f'К обработке: {len(todo)}, уже готовы: {skipped}'
+        )
+        if options['dry_run'] or not todo:
+            return
+
+        built = self.build(todo, options['workers'], force)
+        # Сохранение меняет updated и сбрасывает кэш карточек и страниц.
+        for post in Post.objects.filter(pk__in=built).iterator():
+            post.save(update_fields=['updated'])
+
+    def build(self, todo, workers, force):
+        """Строит миниатюры в пуле и возвращает id готовых постов."""
+        # Открытые соединения с базой нельзя делить с дочерними процессами.
+        connections.close_all()
+        built = []
+        failed = 0
+        start = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=max(workers, 1),
+            mp_context=multiprocessing.get_context('fork'),
+        ) as executor:
+            results = executor.map(
+                build, *zip(*todo), [force] * len(todo), chunksize=4
+            )
+            for done, (post_id, ok) in enumerate(results, 1):
+                if ok:
+                    built.append(post_id)
+                else:
+                    failed += 1
+                if done % PROGRESS_EVERY == 0 or done == len(todo):
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(
+                        f'{done}/{len(todo)}  '
+                        f'{done / elapsed:.1f} картинок/с'
+                    )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Готово: {len(built)}, ошибок: {failed}, '
+            f'{elapsed:.1f} с, {len(todo) / elapsed:.1f} картинок/с'
+        )
+        return built
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает полнотекстовый индекс постов по таблице постов '
+        'и восстанавливает его триггеры.'
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        search.rebuild()
+        self.stdout.write(
+            f'Проиндексировано постов: {Post.objects.count()} '
+            f'за {time.perf_counter() - start:.2f} с'
+        )
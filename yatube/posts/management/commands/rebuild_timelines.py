@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import TimelineEntry
+from posts.timeline import rebuild_timelines, restore_pending
+
+
+class Command(BaseCommand):
+    help = 'Заново собирает ленты подписок по таблице Follow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pending',
+            action='store_true',
+            help='Только вернуть в push авторов, опустившихся ниже порога.',
+        )
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            count = restore_pending()
+            self.stdout.write(f'Авторов возвращено в push: {count}')
+            return
+        rebuild_timelines()
+        self.stdout.write(
+            f'Записей в лентах: {TimelineEntry.objects.count()}'
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов и комментариев.'
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters()
+        for name, count in fixed.items():
+            self.stdout.write(f'{name}: исправлено {count}')
@@ -0,0 +1,65 @@
+# Generated by Django 2.2.16 on 2026-10-18 16:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_subquery(model, field, outer='pk'):
+    rows = (
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Group = apps.get_model('posts', 'Group')
+    Comment = apps.get_model('posts', 'Comment')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    AuthorStats.objects.bulk_create(
+        AuthorStats(author_id=author_id)
+        for author_id in Post.objects.order_by()
+        .values_list('author_id', flat=True).distinct()
+    )
+    Group.objects.update(posts_count=count_subquery(Post, 'group'))
+    Post.objects.update(comments_count=count_subquery(Comment, 'post'))
+    AuthorStats.objects.update(
+        posts_count=count_subquery(Post, 'author', outer='author')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0007_auto_20220524_0913'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Число постов')),
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
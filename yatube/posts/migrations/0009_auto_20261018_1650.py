@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-18 16:50
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    keep = (
+        Follow.objects.values('user', 'author')
+        .annotate(keep_id=Min('id'))
+        .values('keep_id')
+    )
+    Follow.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_auto_20261018_1648'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['pub_date'], name='post_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'pub_date'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'pub_date'], name='post_group_pub_date_idx'),
+        ),
+        migrations.RunPython(
+            drop_duplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
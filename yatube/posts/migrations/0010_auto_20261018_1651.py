@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 16:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    follows = Follow.objects.values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator():
+        posts = (
+            Post.objects.filter(author_id=author_id)
+            .order_by('-pub_date', '-pk')
+            .values_list('pk', 'pub_date')[:settings.TIMELINE_LIMIT]
+        )
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts
+            ),
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_auto_20261018_1650'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'pub_date', 'post'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-18 16:54
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_followers_count(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    AuthorStats.objects.bulk_create(
+        AuthorStats(author_id=author_id)
+        for author_id in Follow.objects.filter(author__stats__isnull=True)
+        .order_by().values_list('author_id', flat=True).distinct()
+    )
+    followers = (
+        Follow.objects.filter(author=OuterRef('author'))
+        .order_by()
+        .values('author')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    AuthorStats.objects.update(
+        followers_count=Coalesce(Subquery(followers), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_auto_20261018_1651'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='followers_count',
+            field=models.IntegerField(default=0, verbose_name='Число подписчиков'),
+        ),
+        migrations.RunPython(fill_followers_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:29
+
+from django.db import migrations, models
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_image_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, height_field='image_height', storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка', width_field='image_width'),
+        ),
+    ]
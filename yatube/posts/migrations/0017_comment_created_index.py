@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created'], name='comment_created_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled(apps, schema_editor):
+    # До этой миграции pull-автором был любой автор с порогом подписчиков.
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    AuthorStats.objects.filter(
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD
+    ).update(pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_comment_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='pulled',
+            field=models.BooleanField(default=False, verbose_name='Лента читается при показе'),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
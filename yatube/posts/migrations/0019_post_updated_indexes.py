@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_authorstats_pulled'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['updated'], name='post_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'updated'], name='post_author_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'updated'], name='post_group_updated_idx'),
+        ),
+    ]
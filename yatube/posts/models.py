@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -12,17 +14,39 @@ class Group(models.Model):
     )
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.IntegerField(
+        'Число постов',
+        default=0,
+        editable=False,
+    )
 
     def __str__(self):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """
+        Посты для лент: автор и группа подтягиваются одним JOIN,
+        а неиспользуемые в карточке поста колонки не читаются.
+        """
+        return self.select_related('author', 'group').defer(
+            'author__password',
+            'author__email',
+            'author__last_login',
+            'author__date_joined',
+            'group__description',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
         help_text='Здесь вы можете написать содержание поста',
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    # Меняется при каждом сохранении и входит в ключ кэша карточки поста.
+    updated = models.DateTimeField('Изменён', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -36,12 +60,40 @@ class Post(models.Model):
         on_delete=models.SET_NULL,
         related_name='groups'
     )
+    # Индекс нужен поиску постов по имени картинки: gc_media,
+    # rename_image и команды, читающие имена по порядку.
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
         blank=True,
+        db_index=True,
+        storage=ContentAddressedStorage(),
+    )
+    # Размеры картинки пишутся при загрузке, и шаблоны выводят их,
+    # не открывая файл. Это не width_field и height_field поля image:
+    # с ними ImageField открывал бы файл каждого поста из базы
+    # с пустыми размерами, см. posts.signals.fill_image_dimensions.
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    comments_count = models.IntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False,
     )
 
+    objects = PostQuerySet.as_manager()
+
     def __str__(self):
         return self.text[:15]
 
@@ -49,6 +101,29 @@ class Post(models.Model):
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # В SQLite к ключу индекса неявно добавляется id,
+        # поэтому эти индексы обслуживают и сортировку (pub_date, id).
+        indexes = [
+            models.Index(fields=['pub_date'], name='post_pub_date_idx'),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', 'pub_date'],
+                name='post_group_pub_date_idx',
+            ),
+            # Last-Modified лент, см. posts.conditional.
+            models.Index(fields=['updated'], name='post_updated_idx'),
+            models.Index(
+                fields=['author', 'updated'],
+                name='post_author_updated_idx',
+            ),
+            models.Index(
+                fields=['group', 'updated'],
+                name='post_group_updated_idx',
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -75,6 +150,14 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx',
+            ),
+            # Общий список комментариев в админке идёт по created.
+            models.Index(fields=['created'], name='comment_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -95,4 +178,67 @@ class Follow(models.Model):
                 check=~models.Q(author=models.F('user')),
                 name='author_exclude_user'
             ),
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Счётчики автора, которые нельзя хранить в модели User."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stats',
+    )
+    posts_count = models.IntegerField(
+        'Число постов',
+        default=0,
+    )
+    followers_count = models.IntegerField(
+        'Число подписчиков',
+        default=0,
+    )
+    # Посты автора читаются при показе ленты, а не раскладываются,
+    # см. posts.timeline.
+    pulled = models.BooleanField(
+        'Лента читается при показе',
+        default=False,
+    )
+
+    def __str__(self):
+        return f'{self.author}: {self.posts_count}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Запись ленты подписок: пост автора, разложенный подписчику
+    в момент публикации. pub_date копируется из поста, чтобы
+    лента читалась одним диапазоном индекса.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_pub_date_idx',
+            ),
         ]
@@ -0,0 +1,99 @@
+"""
+Кэш страниц с версиями вместо короткого таймаута.
+
+Каждая область (вся лента, группа, автор, пост, пользователь) имеет
+счётчик-версию в кэше. Ключ закэшированной страницы включает версии
+её областей, поэтому запись в базу, сдвинувшая версию, сразу делает
+старую копию недостижимой, а сама копия может жить часами.
+Рядом с версией хранится время последнего сдвига: по нему
+Last-Modified отражает и удаления, которых не видно в таблице.
+"""
+import datetime as dt
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.views.decorators.cache import cache_page
+
+VERSION_PREFIX = 'page_version'
+MODIFIED_PREFIX = 'page_modified'
+
+
+def version_key(scope):
+    return f'{VERSION_PREFIX}:{scope}'
+
+
+def modified_key(scope):
+    return f'{MODIFIED_PREFIX}:{scope}'
+
+
+def new_version():
+    # Версия из текущего времени не повторяет прежние значения,
+    # даже если ключ версии был вытеснен из кэша.
+    return time.time_ns() // 1000
+
+
+def bump(*scopes):
+    """Сдвигает версии областей, пропуская пустые."""
+    scopes = [scope for scope in scopes if scope is not None]
+    for scope in scopes:
+        key = version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), None)
+    now = time.time()
+    cache.set_many({modified_key(scope): now for scope in scopes}, None)
+
+
+def last_modified(scopes):
+    """Время последнего сдвига любой из областей или None."""
+    found = cache.get_many([modified_key(scope) for scope in scopes])
+    if not found:
+        return None
+    return dt.datetime.fromtimestamp(max(found.values()), dt.timezone.utc)
+
+
+def get_versions(scopes):
+    """Версии областей одной строкой, недостающие создаются."""
+    keys = [version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, new_version(), None)
+        found.update(cache.get_many(missing))
+    return '.'.join(str(found.get(key, 0)) for key in keys)
+
+
+def user_scope(request, **kwargs):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return None
+
+
+def group_scope(request, slug, **kwargs):
+    return f'group:{slug}'
+
+
+def versioned_cache_page(timeout, *scopes):
+    """
+    cache_page, чей ключ включает версии областей scopes.
+
+    Область - строка или функция (request, **kwargs),
+    возвращающая строку или None.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            names = []
+            for scope in scopes:
+                if callable(scope):
+                    scope = scope(request, **kwargs)
+                if scope is not None:
+                    names.append(scope)
+            key_prefix = f'{view.__name__}:{get_versions(names)}'
+            cached_view = cache_page(timeout, key_prefix=key_prefix)(view)
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,277 @@
+import base64
+import datetime as dt
+import heapq
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = dt.timedelta(microseconds=1)
+# Сколько живёт закэшированное число постов ленты, в секундах.
+COUNT_CACHE_TIMEOUT = 60 * 60
+# Сколько номеров страниц показывать по каждую сторону от текущей.
+PAGE_WINDOW = 3
+
+
+def feed_count_key(scope, value=''):
+    """Ключ кэша с числом постов ленты: index, group, author."""
+    return f'feed_count:{scope}:{value}'
+
+
+def encode_token(*parts):
+    """Кодирует части позиции в непрозрачный токен для адреса."""
+    raw = ':'.join(str(part) for part in parts).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Части позиции строками или None, если токен битый."""
+    try:
+        padding = '=' * (-len(token) % 4)
+        return base64.urlsafe_b64decode(token + padding).decode().split(':')
+    except (ValueError, TypeError):
+        return None
+
+
+def encode_cursor(post):
+    """Кодирует позицию поста (pub_date, id) в непрозрачный токен."""
+    return encode_token((post.pub_date - EPOCH) // ONE_MICROSECOND, post.pk)
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) из токена или None, если токен битый."""
+    try:
+        stamp, pk = decode_token(token)
+        return EPOCH + int(stamp) * ONE_MICROSECOND, int(pk)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def post_key(post):
+    return post.pub_date, post.pk
+
+
+class FeedSource:
+    """
+    Лента постов, упорядоченная по ключу (pub_date, id).
+
+    key задаёт поля ключа в queryset, а transform превращает
+    выбранные строки в посты, если лента строится не по Post.
+    """
+
+    def __init__(self, queryset, key=('pub_date', 'pk'), transform=None,
+                 descending=True):
+        self.key = key
+        self.transform = transform
+        self.descending = descending
+        prefix = '-' if descending else ''
+        self.queryset = queryset.order_by(
+            *(f'{prefix}{field}' for field in key)
+        )
+
+    def _clone(self, queryset, descending):
+        return FeedSource(queryset, self.key, self.transform, descending)
+
+    def seek(self, pub_date, pk):
+        """Посты строго за позицией (pub_date, pk) в порядке ленты."""
+        date_field, pk_field = self.key
+        lookup = 'lt' if self.descending else 'gt'
+        return self._clone(
+            self.queryset.filter(
+                Q(**{f'{date_field}__{lookup}': pub_date})
+                | Q(**{date_field: pub_date, f'{pk_field}__{lookup}': pk})
+            ),
+            self.descending,
+        )
+
+    def reverse(self):
+        return self._clone(self.queryset, not self.descending)
+
+    def count(self):
+        return self.queryset.count()
+
+    def __getitem__(self, index):
+        rows = list(self.queryset[index])
+        if self.transform is not None:
+            rows = self.transform(rows)
+        return rows
+
+
+class MergedFeed:
+    """
+    Слияние нескольких FeedSource в одну ленту.
+
+    Каждый источник отдаёт не больше stop постов по своему индексу,
+    а heapq.merge сливает их по ключу (pub_date, id).
+    """
+
+    def __init__(self, sources, descending=True):
+        self.sources = sources
+        self.descending = descending
+
+    def seek(self, pub_date, pk):
+        return MergedFeed(
+            [source.seek(pub_date, pk) for source in self.sources],
+            self.descending,
+        )
+
+    def reverse(self):
+        return MergedFeed(
+            [source.reverse() for source in self.sources],
+            not self.descending,
+        )
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop
+        merged = heapq.merge(
+            *(source[:stop] for source in self.sources),
+            key=post_key,
+            reverse=self.descending,
+        )
+        posts = []
+        seen = set()
+        for post in merged:
+            if post.pk in seen:
+                continue
+            seen.add(post.pk)
+            posts.append(post)
+            if len(posts) == stop:
+                break
+        return posts[start:stop]
+
+
+class CursorPaginator(Paginator):
+    """
+    Паджинатор по ключу (pub_date, id).
+
+    Номерные страницы работают как у обычного Paginator,
+    а get_cursor_page выбирает страницу диапазоном по индексу,
+    поэтому её стоимость не зависит от глубины.
+    Каждой странице проставляются next_cursor, previous_cursor
+    и page_window - ограниченное окно номеров вокруг текущей.
+    Номер страницы по курсору неизвестен, и окно у неё пустое.
+    Исключение - последняя страница при известном числе постов: она
+    совпадает с номерной, как и страницы перед ней по курсору before.
+
+    Число постов берётся из готового счётчика total или из кэша
+    по count_key, а при with_count=False не считается вовсе:
+    страница знает только, есть ли следующая.
+
+    object_list - QuerySet постов, FeedSource или MergedFeed.
+    """
+    cursor_mode = False
+
+    def __init__(self, object_list, per_page, total=None, count_key=None,
+                 with_count=True, **kwargs):
+        if isinstance(object_list, QuerySet):
+            object_list = FeedSource(object_list)
+        super().__init__(object_list, per_page, **kwargs)
+        self.total = total
+        self.count_key = count_key
+        self.with_count = with_count
+
+    @cached_property
+    def count(self):
+        if self.total is not None:
+            return self.total
+        if self.count_key is None:
+            return super().count
+        count = cache.get(self.count_key)
+        if count is None:
+            count = super().count
+            cache.set(self.count_key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_page(self, number):
+        if self.with_count:
+            return super().get_page(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        number = max(number, 1)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            return self.get_page(1)
+        return self._page_from_rows(
+            rows[:self.per_page], number,
+            has_next=len(rows) > self.per_page,
+        )
+
+    def _get_page(self, object_list, number, paginator):
+        page = super()._get_page(list(object_list), number, paginator)
+        if self.cursor_mode:
+            page.page_window = range(0)
+        else:
+            page.page_window = range(
+                max(number - PAGE_WINDOW, 1),
+                min(number + PAGE_WINDOW, self.num_pages) + 1
+            )
+        page.next_cursor = None
+        page.previous_cursor = None
+        if page.object_list and page.has_next():
+            page.next_cursor = encode_cursor(page[-1])
+        if page.object_list and page.has_previous():
+            page.previous_cursor = encode_cursor(page[0])
+        return page
+
+    def get_cursor_page(self, after=None, before=None):
+        """
+        Страница после курсора after или перед курсором before.
+
+        Пустой before означает последнюю страницу ленты.
+        """
+        if before is not None:
+            position = decode_cursor(before) if before else None
+            if before and position is None:
+                return self._page_after(None)
+            return self._page_before(position)
+        return self._page_after(decode_cursor(after) if after else None)
+
+    def _page_from_rows(self, object_list, number, has_next):
+        # Число страниц здесь условное: его хватает, чтобы
+        # has_next/has_previous у Page работали без COUNT(*).
+        self.num_pages = number + 1 if has_next else number
+        return self._get_page(object_list, number, self)
+
+    def _cursor_page(self, object_list, has_next, has_previous, number=None):
+        if number is None:
+            self.cursor_mode = True
+            number = 2 if has_previous else 1
+        return self._page_from_rows(object_list, number, has_next)
+
+    def _page_after(self, position):
+        feed = self.object_list
+        if position is not None:
+            feed = feed.seek(*position)
+        rows = feed[:self.per_page + 1]
+        return self._cursor_page(
+            rows[:self.per_page],
+            has_next=len(rows) > self.per_page,
+            has_previous=position is not None,
+        )
+
+    def _page_before(self, position):
+        feed = self.object_list.reverse()
+        size = self.per_page
+        number = None
+        if position is not None:
+            feed = feed.seek(*position)
+        elif self.with_count:
+            # Последняя страница - остаток ленты, как номерная num_pages.
+            size = self.count % self.per_page or self.per_page
+            number = self.num_pages
+        rows = feed[:size + 1]
+        return self._cursor_page(
+            rows[:size][::-1],
+            has_next=position is not None,
+            has_previous=len(rows) > size,
+            number=number,
+        )
@@ -0,0 +1,134 @@
+"""
+Полнотекстовый поиск по постам на FTS5.
+
+posts_post_fts - внешний индекс FTS5 над posts_post.text: он хранит
+только токены, сам текст берётся из posts_post по rowid = id.
+Индекс обновляют триггеры базы, поэтому его не обходят update(),
+bulk_create и правки из shell. SQLite пересоздаёт таблицу при
+многих миграциях, а с ней пропадают триггеры, поэтому install_triggers
+повторяется после каждого migrate.
+
+Запрос разбивается на слова, каждое ищется как префикс. Результаты
+упорядочены по bm25 и id, следующая страница начинается после пары
+(ранг, id) последнего результата: OFFSET не нужен.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .paginators import decode_token, encode_token
+
+TABLE = 'posts_post_fts'
+TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END''',
+)
+# Сколько слов вокруг совпадения показывает сниппет.
+SNIPPET_TOKENS = 16
+# Маркеры совпадений в сниппете: управляющие символы не встречаются
+# в тексте и переживают экранирование HTML.
+MARK_START, MARK_END = '\x02', '\x03'
+WORD = re.compile(r'\w+')
+
+
+def install_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Создаёт триггеры индекса, если их нет. Подключён к post_migrate;
+    пока миграция с таблицей индекса не применена, ничего не делает.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite' or TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+
+
+def rebuild():
+    """Перестраивает индекс по posts_post и сжимает его."""
+    install_triggers()
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+
+
+def match_expression(query):
+    """
+    Строка MATCH из запроса пользователя: все слова как префиксы.
+    Синтаксис FTS5 в запросе не работает: слова берутся в кавычки.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query.lower()))
+
+
+def encode_cursor(rank, post_id):
+    """Кодирует позицию результата (rank, id) в непрозрачный токен."""
+    return encode_token(repr(rank), post_id)
+
+
+def decode_cursor(token):
+    """Возвращает (rank, id) из токена или None, если токен битый."""
+    try:
+        rank, post_id = decode_token(token)
+        return float(rank), int(post_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def render_snippet(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def search(query, limit, after=None):
+    """
+    Список (id поста, rank, сниппет) по запросу, лучшие первыми,
+    не больше limit штук. after - (rank, id) последнего результата
+    прошлой страницы.
+    """
+    match = match_expression(query)
+    if not match:
+        return []
+    sql = (
+        f'SELECT rowid, rank, snippet({TABLE}, 0, %s, %s, %s, %s) '
+        f'FROM {TABLE} WHERE {TABLE} MATCH %s'
+    )
+    params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, match]
+    if after is not None:
+        # Равенство по скрытой колонке rank FTS5 читает как выбор
+        # функции ранжирования, унарный плюс делает его обычным условием.
+        sql += ' AND (+rank > %s OR +rank = %s AND rowid > %s)'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            (post_id, rank, render_snippet(snippet))
+            for post_id, rank, snippet in cursor.fetchall()
+        ]
+
+
+def matching_ids_sql(query):
+    """(SQL, параметры) подзапроса id постов для фильтра pk__in."""
+    return (
+        f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s',
+        [match_expression(query)],
+    )
@@ -0,0 +1,242 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.images import get_image_dimensions
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from . import page_cache, thumbnails, timeline
+from .models import AuthorStats, Comment, Follow, Group, Post
+from .paginators import feed_count_key
+
+User = get_user_model()
+
+# Поля пользователя, которые выводятся на страницах с постами.
+PROFILE_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def change_author_stats(author_id, field, delta):
+    updated = AuthorStats.objects.filter(author_id=author_id).update(
+        **{field: F(field) + delta}
+    )
+    if not updated and delta > 0:
+        AuthorStats.objects.get_or_create(
+            author_id=author_id,
+            defaults={
+                'posts_count': (
+                    Post.objects.filter(author_id=author_id).count()
+                ),
+                'followers_count': (
+                    Follow.objects.filter(author_id=author_id).count()
+                ),
+            },
+        )
+
+
+def change_group_posts(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=F('posts_count') + delta
+        )
+
+
+def bump_post_pages(post, *group_ids):
+    """Сдвигает версии всех страниц, где показывается пост."""
+    usernames = User.objects.filter(pk=post.author_id).values_list(
+        'username', flat=True
+    )
+    slugs = Group.objects.filter(
+        pk__in={post.group_id, *group_ids} - {None}
+    ).values_list('slug', flat=True)
+    page_cache.bump(
+        'global',
+        f'post:{post.pk}',
+        *(f'author:{username}' for username in usernames),
+        *(f'group:{slug}' for slug in slugs),
+    )
+
+
+@receiver(pre_save, sender=Post)
+def fill_image_dimensions(sender, instance, **kwargs):
+    """
+    Считает размеры только новой загрузки, которая ещё в памяти.
+    Размеры старых строк заполняет backfill_image_dimensions.
+    """
+    if 'image' not in instance.__dict__:
+        return
+    image = instance.image
+    if not image:
+        instance.image_width = instance.image_height = None
+    elif not image._committed:
+        instance.image_width, instance.image_height = get_image_dimensions(
+            image.file
+        )
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, **kwargs):
+    """
+    Запоминает прежние группу и картинку поста, чтобы поправить
+    счётчик группы и построить миниатюры новой картинки.
+    """
+    instance._old_group_id = None
+    instance._old_image = ''
+    if instance.pk is not None:
+        instance._old_group_id, instance._old_image = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image')
+            .first()
+        ) or (None, '')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    cache.delete(feed_count_key('index'))
+    old_group_id = getattr(instance, '_old_group_id', None)
+    bump_post_pages(instance, old_group_id)
+    old_image = getattr(instance, '_old_image', '')
+    if instance.image.name != old_image:
+        if old_image:
+            transaction.on_commit(lambda: thumbnails.forget_image(old_image))
+        if instance.image:
+            thumbnails.queue_thumbnails(instance.pk)
+    if created:
+        change_author_stats(instance.author_id, 'posts_count', 1)
+        change_group_posts(instance.group_id, 1)
+        timeline.fan_out(instance)
+        return
+    if old_group_id != instance.group_id:
+        change_group_posts(old_group_id, -1)
+        change_group_posts(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    cache.delete(feed_count_key('index'))
+    bump_post_pages(instance)
+    image = instance.image.name
+    if image:
+        transaction.on_commit(lambda: thumbnails.forget_image(image))
+    change_author_stats(instance.author_id, 'posts_count', -1)
+    change_group_posts(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    page_cache.bump(f'post:{instance.post_id}')
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    page_cache.bump(f'post:{instance.post_id}')
+    Post.objects.filter(pk=instance.post_id).update(
+        comments_count=F('comments_count') - 1
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    page_cache.bump(f'user:{instance.user_id}')
+    if created:
+        change_author_stats(instance.author_id, 'followers_count', 1)
+        timeline.update_mode(instance.author_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    page_cache.bump(f'user:{instance.user_id}')
+    change_author_stats(instance.author_id, 'followers_count', -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.update_mode(instance.author_id)
+
+
+def group_pages(group, *slugs):
+    """Области страниц, где видны название, описание или slug группы."""
+    return [f'group:{slug}' for slug in {group.slug, *slugs} - {None}]
+
+
+def author_pages(posts):
+    """Области профилей авторов постов posts."""
+    usernames = User.objects.filter(
+        pk__in=posts.values('author_id')
+    ).values_list('username', flat=True)
+    return [f'author:{username}' for username in usernames]
+
+
+@receiver(pre_save, sender=Group)
+def remember_old_slug(sender, instance, **kwargs):
+    instance._old_slug = None
+    if instance.pk is not None:
+        instance._old_slug = (
+            Group.objects.filter(pk=instance.pk)
+            .values_list('slug', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    # Страница группы и страницы её постов зависят от группы
+    # через её область, а slug есть ещё в карточках постов.
+    old_slug = getattr(instance, '_old_slug', None)
+    scopes = group_pages(instance, old_slug)
+    if old_slug is not None and old_slug != instance.slug:
+        scopes += ['global', *author_pages(instance.groups.all())]
+    page_cache.bump(*scopes)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_pages(sender, instance, **kwargs):
+    # После удаления посты группы уже отвязаны от неё.
+    instance._pages = [
+        'global',
+        *group_pages(instance),
+        *author_pages(instance.groups.all()),
+    ]
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    page_cache.bump(*getattr(instance, '_pages', group_pages(instance)))
+
+
+@receiver(pre_save, sender=User)
+def remember_old_profile(sender, instance, update_fields=None, **kwargs):
+    """Запоминает выводимые на страницах поля пользователя."""
+    instance._old_profile = None
+    if instance.pk is None or (
+        update_fields is not None
+        and not set(update_fields) & set(PROFILE_FIELDS)
+    ):
+        return
+    instance._old_profile = (
+        User.objects.filter(pk=instance.pk)
+        .values_list(*PROFILE_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_profile', None)
+    new = tuple(getattr(instance, field) for field in PROFILE_FIELDS)
+    if old is None or old == new:
+        return
+    # Имя автора есть в карточках всех лент, в профиле, на страницах
+    # его постов (их ETag включает область автора) и в шапке сайта.
+    slugs = Group.objects.filter(
+        pk__in=instance.posts.values('group_id')
+    ).values_list('slug', flat=True)
+    page_cache.bump(
+        'global',
+        f'user:{instance.pk}',
+        f'author:{old[0]}',
+        f'author:{instance.username}',
+        *(f'group:{slug}' for slug in slugs),
+    )
@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 2 ** 10
+
+
+def content_hash(content):
+    """sha256 содержимого файла, позиция в файле не меняется."""
+    digest = hashlib.sha256()
+    position = content.tell() if hasattr(content, 'tell') else None
+    content.seek(0)
+    for chunk in iter(lambda: content.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    content.seek(position or 0)
+    return digest.hexdigest()
+
+
+def content_name(name, digest):
+    """posts/x.JPG -> posts/ab/ab12....jpg"""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, где имя файла - sha256 его содержимого.
+
+    Повторная загрузка тех же байтов возвращает имя уже лежащего
+    файла, поэтому у него остаются и готовые миниатюры.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content_hash(content))
+        if not self.touch(name):
+            try:
+                name = self._save(name, content)
+            except FileExistsError:
+                # Те же байты только что сохранил другой запрос.
+                pass
+        return name.replace('\\', '/')
+
+    def touch(self, name):
+        """
+        Обновляет mtime файла, если он есть. gc_media не трогает свежие
+        файлы, и повторно загруженный файл доживёт до коммита поста.
+        """
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def get_available_name(self, name, max_length=None):
+        # Занятое имя значит, что файл с тем же содержимым уже есть.
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
@@ -0,0 +1,68 @@
+from django import template
+
+from ..thumbnails import (
+    CARD_GEOMETRY, FALLBACK_WIDTH, picture_variants, queue_thumbnails,
+    ready_thumbnail,
+)
+
+register = template.Library()
+
+# Ширина картинки на странице для sizes: во всю ширину узкого экрана,
+# иначе не больше колонки контейнера.
+SIZES = {
+    'card': '(max-width: 992px) 100vw, 960px',
+    'detail': '(max-width: 767px) 100vw, 720px',
+}
+
+
+def picture_box(post, kind):
+    """
+    Ширина и высота рамки картинки без чтения файла: у карточки
+    пропорции CARD_GEOMETRY, у страницы поста - размеры из базы.
+    """
+    if kind == 'card':
+        return tuple(map(int, CARD_GEOMETRY.split('x')))
+    if post.image_width and post.image_height:
+        return post.image_width, post.image_height
+    return None, None
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(post, kind='card', loading='lazy'):
+    """
+    {% post_picture post "detail" loading="eager" %}
+
+    <picture> картинки поста: WebP и исходный формат в нескольких
+    ширинах, srcset и sizes, размеры, рамка с пропорциями картинки
+    и ленивая загрузка. Пока основной миниатюры нет, выводится
+    заглушка; в srcset попадают только готовые варианты,
+    недостающие ставятся в очередь.
+    """
+    width, height = picture_box(post, kind)
+    context = {
+        'image': post.image,
+        'sizes': SIZES[kind],
+        'loading': loading,
+        'width': width,
+        'height': height,
+    }
+    if not post.image:
+        return context
+    srcsets = {}
+    missing = False
+    for image_format, geometry, options, target in picture_variants(kind):
+        thumbnail = ready_thumbnail(post.image, geometry, **options)
+        if thumbnail is None:
+            missing = True
+            continue
+        if image_format is None and target == FALLBACK_WIDTH:
+            context['fallback'] = thumbnail
+        # Без увеличения у маленькой картинки варианты совпадают.
+        srcsets.setdefault(image_format, {}).setdefault(
+            thumbnail.width, f'{thumbnail.url} {thumbnail.width}w'
+        )
+    if missing:
+        queue_thumbnails(post.pk)
+    context['srcset'] = ', '.join(srcsets.get(None, {}).values())
+    context['webp_srcset'] = ', '.join(srcsets.get('WEBP', {}).values())
+    return context
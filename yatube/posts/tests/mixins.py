@@ -0,0 +1,48 @@
+import itertools
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
+
+
+class MediaTestMixin:
+    """
+    Свой каталог media на класс тестов внутри временного MEDIA_ROOT
+    из yatube.test_settings и загрузки картинок для постов.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        cls.media_root = tempfile.mkdtemp(dir=settings.MEDIA_ROOT)
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        cls.colors = itertools.count()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def isolate_media(self, name):
+        """Отдельный MEDIA_ROOT до конца теста; возвращает его путь."""
+        media_root = os.path.join(self.media_root, name)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        return media_root
+
+    def upload(self, name):
+        # Разное содержимое: одинаковые байты хранятся одним файлом.
+        content = BytesIO()
+        Image.new('L', (2, 1), next(self.colors)).save(content, 'GIF')
+        return SimpleUploadedFile(
+            name=name, content=content.getvalue(), content_type='image/gif'
+        )
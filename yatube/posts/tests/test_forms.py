@@ -1,15 +1,14 @@
-import shutil
-import tempfile
+from io import BytesIO
 
-from django.test import Client, TestCase, override_settings
+from django.test import Client, TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
+from ..forms import PostForm
 from ..models import Post, Group, Comment
-
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+from .mixins import MediaTestMixin
 
 User = get_user_model()
 
@@ -88,8 +87,7 @@ class FormsTest(TestCase):
         self.assertNotEqual(old_text.text, new_text.text)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
-class ImageFormTest(FormsTest):
+class ImageFormTest(MediaTestMixin, FormsTest):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -119,11 +117,6 @@ class ImageFormTest(FormsTest):
             image=cls.uploaded
         )
 
-    @classmethod
-    def tearDownClass(cls):
-        super().tearDownClass()
-        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
-
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(ImageFormTest.user)
@@ -149,10 +142,10 @@ class ImageFormTest(FormsTest):
                 response = self.authorized_client.get(adress)
                 if page != 'post_detail':
                     for image in response.context.get('page_obj'):
-                        self.assertEqual(image.image, 'posts/small.gif')
+                        self.assertEqual(image.image, self.post.image)
                 else:
                     image = response.context.get('posts')
-                    self.assertEqual(image.image, 'posts/small.gif')
+                    self.assertEqual(image.image, self.post.image)
 
     def test_upload_image(self):
         """Тест на загрузку картинки через PostForm."""
@@ -175,10 +168,11 @@ class ImageFormTest(FormsTest):
             response,
             reverse('posts:profile', kwargs={'username': self.user})
         )
+        # Те же байты под другим именем ссылаются на уже лежащий файл.
         self.assertTrue(Post.objects.filter(
             text='Test post_method upload',
             author=self.user,
-            image='posts/small_2.gif'
+            image=self.post.image.name
         ).exists())
 
     def test_upload_not_image(self):
@@ -204,6 +198,28 @@ class ImageFormTest(FormsTest):
         error_message = 'При попытке загрузить строку, всё получилось о_О'
         self.assertTrue(has_type_error, error_message)
 
+    def test_upload_truncated_image(self):
+        """Обрезанная картинка - ошибка формы, а не 500."""
+        content = BytesIO()
+        Image.effect_noise((300, 200), 64).save(content, 'JPEG')
+        uploaded = SimpleUploadedFile(
+            name='truncated.jpg',
+            content=content.getvalue()[:content.tell() // 2],
+            content_type='image/jpeg',
+        )
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Test_upload_truncated', 'image': uploaded},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response, 'form', 'image',
+            PostForm.base_fields['image'].error_messages['invalid_image'],
+        )
+        self.assertFalse(
+            Post.objects.filter(text='Test_upload_truncated').exists()
+        )
+
 
 class CommentTest(FormsTest):
     @classmethod
@@ -0,0 +1,268 @@
+import os
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+
+from ..images import rename_image
+from ..management.commands import gc_media
+from ..models import Post
+from ..thumbnails import (
+    CARD_GEOMETRY, CARD_OPTIONS, generate_thumbnails, is_ready,
+    ready_thumbnail, source_file,
+)
+from .mixins import MediaTestMixin
+
+User = get_user_model()
+
+
+class ImageStorageTest(MediaTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='User_with_images')
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear_lru()
+
+    def test_reupload_reuses_file_and_thumbnails(self):
+        """Повторная загрузка тех же байтов берёт готовый файл и миниатюры"""
+        content = self.upload('first.gif').read()
+        first = Post.objects.create(
+            text='First', author=self.user,
+            image=SimpleUploadedFile('first.gif', content),
+        )
+        generate_thumbnails(first.pk)
+        second = Post.objects.create(
+            text='Second', author=self.user,
+            image=SimpleUploadedFile('second.GIF', content),
+        )
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertTrue(is_ready(second.image))
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_dedupe_images(self):
+        """dedupe_images переносит файлы под хэш и удаляет дубликаты"""
+        content = self.upload('old.gif').read()
+        storage = Post._meta.get_field('image').storage
+        names = ['posts/old.gif', 'posts/old_Xy12ab.gif']
+        os.makedirs(storage.path('posts'), exist_ok=True)
+        for name in names:
+            with open(storage.path(name), 'wb') as file:
+                file.write(content)
+        posts = [
+            Post.objects.create(text='Old', author=self.user, image=name)
+            for name in names
+        ]
+        call_command('dedupe_images', dry_run=True, stdout=StringIO())
+        self.assertTrue(all(storage.exists(name) for name in names))
+        out = StringIO()
+        call_command('dedupe_images', stdout=out)
+        self.assertIn(
+            'перенесено файлов: 1, удалено дубликатов: 1', out.getvalue()
+        )
+        for post in posts:
+            post.refresh_from_db()
+        self.assertEqual(posts[0].image.name, posts[1].image.name)
+        self.assertTrue(storage.exists(posts[0].image.name))
+        self.assertFalse(any(storage.exists(name) for name in names))
+
+    def test_gc_media(self):
+        """gc_media убирает картинки и миниатюры без постов"""
+        self.isolate_media('gc')
+        kept, deleted = [
+            Post.objects.create(
+                text='GC', author=self.user, image=self.upload(name)
+            )
+            for name in ('kept.gif', 'deleted.gif')
+        ]
+        for post in (kept, deleted):
+            generate_thumbnails(post.pk)
+        thumbnail = ready_thumbnail(
+            deleted.image, CARD_GEOMETRY, **CARD_OPTIONS
+        )
+        # Коммита в TestCase нет: записи KV удалённого поста остаются.
+        deleted.delete()
+        storage = default.storage
+        strays = ['posts/stray.gif', 'cache/zz/stray.jpg']
+        for name in strays:
+            storage.save(name, ContentFile(b'stray'))
+        quarantine = os.path.join(self.media_root, 'quarantine')
+
+        out = StringIO()
+        call_command('gc_media', dry_run=True, stdout=out)
+        # Свежие файлы и записи KV их картинок не трогаются.
+        self.assertIn('картинок 0', out.getvalue())
+        self.assertIn('записей KV 0', out.getvalue())
+
+        out = StringIO()
+        call_command('gc_media', dry_run=True, min_age=0, stdout=out)
+        self.assertIn('картинок 2', out.getvalue())
+        self.assertIn('записей KV 1', out.getvalue())
+        self.assertIn('миниатюр 1', out.getvalue())
+        self.assertTrue(storage.exists(deleted.image.name))
+
+        call_command(
+            'gc_media', quarantine=quarantine, min_age=0, stdout=StringIO()
+        )
+        for name in [deleted.image.name, thumbnail.name, *strays]:
+            self.assertFalse(storage.exists(name))
+            self.assertTrue(os.path.exists(os.path.join(quarantine, name)))
+        self.assertTrue(storage.exists(kept.image.name))
+        self.assertTrue(is_ready(kept.image.name))
+        self.assertIsNone(default.kvstore.get(source_file(deleted.image.name)))
+        call_command('gc_media', stdout=out)
+        self.assertIn('Удалено: картинок 0', out.getvalue())
+
+    def test_gc_media_rechecks_references(self):
+        """Картинку, на которую сослался пост во время сборки, не удаляют"""
+        self.isolate_media('gc_late')
+        storage = Post._meta.get_field('image').storage
+        name = storage.save('posts/late.gif', self.upload('late.gif'))
+        referenced = gc_media.Command.referenced
+
+        def post_appears(command, names):
+            found = referenced(command, names)
+            if not Post.objects.filter(image=name).exists():
+                Post.objects.create(text='Late', author=self.user, image=name)
+            return found
+
+        with mock.patch.object(
+            gc_media.Command, 'referenced', post_appears
+        ):
+            call_command('gc_media', min_age=0, stdout=StringIO())
+        self.assertTrue(storage.exists(name))
+
+
+@override_settings(IMAGE_MAX_SIDE=500)
+class ImageNormalizeTest(MediaTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='User_with_photo')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def photo(self, size, orientation):
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        exif[0x010F] = 'Phone'
+        content = BytesIO()
+        Image.new('RGB', size, 'red').save(content, 'JPEG', exif=exif)
+        return SimpleUploadedFile(
+            'photo.JPG', content.getvalue(), content_type='image/jpeg'
+        )
+
+    def test_upload_is_normalized(self):
+        """Картинка поворачивается, уменьшается и теряет EXIF"""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Photo', 'image': self.photo((1200, 400), 6)},
+        )
+        post = Post.objects.get(text='Photo')
+        image = Image.open(post.image)
+        self.assertEqual(image.size, (167, 500))
+        self.assertEqual((post.image_width, post.image_height), (167, 500))
+        self.assertNotIn('exif', image.info)
+
+    def test_small_clean_image_kept(self):
+        """Маленькую картинку без метаданных форма не пережимает"""
+        content = BytesIO()
+        Image.new('L', (2, 1)).save(content, 'GIF')
+        content = content.getvalue()
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Small',
+                'image': SimpleUploadedFile('small.gif', content),
+            },
+        )
+        self.assertEqual(
+            Post.objects.get(text='Small').image.read(), content
+        )
+
+    def test_normalize_images(self):
+        """normalize_images кладёт файл туда же, куда и загрузка"""
+        post = Post.objects.create(
+            text='Old photo', author=self.user,
+            image=SimpleUploadedFile(
+                'old.jpg', self.photo((1200, 400), 6).read()
+            ),
+        )
+        call_command('normalize_images', stdout=StringIO())
+        post = Post.objects.get(pk=post.pk)
+        with post.image.open() as image:
+            content = image.read()
+        uploaded = Post.objects.create(
+            text='New photo', author=self.user,
+            image=SimpleUploadedFile('new.jpg', content),
+        )
+        self.assertEqual(uploaded.image.name, post.image.name)
+        self.assertRegex(
+            post.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]+\.jpg$'
+        )
+
+
+class ImageDimensionsTest(MediaTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='User_with_dimensions')
+
+    def png(self, size):
+        content = BytesIO()
+        Image.new('RGB', size).save(content, 'PNG')
+        return content.getvalue()
+
+    def test_dimensions_follow_image(self):
+        """Размеры пишутся при загрузке и смене имени, сбрасываются с ней"""
+        post = Post.objects.create(
+            text='New', author=self.user,
+            image=SimpleUploadedFile('new.png', self.png((30, 20))),
+        )
+        self.assertEqual((post.image_width, post.image_height), (30, 20))
+        storage = Post._meta.get_field('image').storage
+        name = storage.save('posts/other.png', ContentFile(self.png((10, 40))))
+        rename_image(post.image.name, name)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (10, 40))
+        post.image = ''
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+
+    def test_backfill_and_render_without_storage(self):
+        """Размеры из базы выводятся без чтения файла"""
+        storage = Post._meta.get_field('image').storage
+        content = BytesIO()
+        Image.new('RGB', (300, 200)).save(content, 'PNG')
+        name = storage.save('posts/old.png', ContentFile(content.getvalue()))
+        post = Post.objects.create(text='Old', author=self.user, image=name)
+        with mock.patch.object(storage, 'open') as storage_open:
+            post = Post.objects.get(pk=post.pk)
+        storage_open.assert_not_called()
+        self.assertIsNone(post.image_width)
+
+        out = StringIO()
+        call_command('backfill_image_dimensions', stdout=out)
+        self.assertIn('Заполнено постов: 1, ошибок: 0', out.getvalue())
+        cache.clear()
+        with mock.patch.object(storage, 'open') as storage_open:
+            response = self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk})
+            )
+        storage_open.assert_not_called()
+        self.assertContains(response, 'aspect-ratio: 300 / 200')
+        self.assertContains(response, 'width="300" height="200"')
@@ -1,8 +1,15 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from django.db import IntegrityError
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.db import IntegrityError, connection
 
-from ..models import Post, Group, Follow
+from ..models import (
+    AuthorStats, Comment, Post, Group, Follow, TimelineEntry
+)
+from ..paginators import CursorPaginator
+from ..timeline import fan_out, follow_feed, is_pulled, pending_authors
 
 User = get_user_model()
 
@@ -81,3 +88,255 @@ class FollowModelTest(TestCase):
                 user=self.user,
                 author=self.user,
             )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Counter_user')
+        cls.group = Group.objects.create(
+            title='Counter group',
+            slug='counter_group',
+            description='counters',
+        )
+        cls.other_group = Group.objects.create(
+            title='Other group',
+            slug='other_group',
+            description='counters',
+        )
+
+    def counters(self, post=None):
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        counters = {
+            'author': AuthorStats.objects.get(author=self.user).posts_count,
+            'group': self.group.posts_count,
+            'other_group': self.other_group.posts_count,
+        }
+        if post is not None:
+            post.refresh_from_db()
+            counters['comments'] = post.comments_count
+        return counters
+
+    def test_counters_follow_posts_and_comments(self):
+        """Счётчики меняются при создании, правке и удалении."""
+        post = Post.objects.create(
+            author=self.user, text='counted', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.user, text='first')
+        self.assertEqual(
+            self.counters(post),
+            {'author': 1, 'group': 1, 'other_group': 0, 'comments': 1}
+        )
+        post.group = self.other_group
+        post.save()
+        post.comments.all().delete()
+        self.assertEqual(
+            self.counters(post),
+            {'author': 1, 'group': 0, 'other_group': 1, 'comments': 0}
+        )
+        post.delete()
+        self.assertEqual(
+            self.counters(),
+            {'author': 0, 'group': 0, 'other_group': 0}
+        )
+
+    def test_reconcile_fixes_drift(self):
+        """Команда reconcile_counters исправляет рассинхрон."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text='bulk', group=self.group)
+            for _ in range(3)
+        )
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(
+            self.counters(),
+            {'author': 3, 'group': 3, 'other_group': 0}
+        )
+
+
+def query_plan(queryset):
+    """Шаги EXPLAIN QUERY PLAN для запроса queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент идут по индексам, без полного скана и сортировки."""
+    def test_feeds_use_indexes(self):
+        """Тест на использование индексов лентами и комментариями."""
+        feed = Post.objects.for_feed().order_by('-pub_date', '-pk')
+        queries = {
+            'index': feed[:11],
+            'group_list': feed.filter(group_id=1)[:11],
+            'profile': feed.filter(author_id=1)[:11],
+            'comments': Comment.objects.filter(
+                post_id=1
+            ).select_related('author'),
+        }
+        for name, queryset in queries.items():
+            with self.subTest(query=name):
+                plan = query_plan(queryset)
+                self.assertTrue(
+                    any('USING INDEX' in step for step in plan), plan
+                )
+                self.assertFalse(
+                    any(step.startswith('SCAN') and 'INDEX' not in step
+                        for step in plan),
+                    plan
+                )
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_follow_is_unique(self):
+        """Нельзя подписаться на автора дважды."""
+        user = User.objects.create(username='Follower')
+        author = User.objects.create(username='Followed')
+        Follow.objects.create(user=user, author=author)
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=user, author=author)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='Timeline_reader')
+        cls.author = User.objects.create(username='Timeline_author')
+
+    def timeline(self):
+        return list(
+            TimelineEntry.objects.filter(user=self.reader)
+            .order_by('-pub_date', '-post_id')
+            .values_list('post_id', flat=True)
+        )
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка подтягивает посты автора, отписка их убирает."""
+        post = Post.objects.create(author=self.author, text='old')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.timeline(), [post.pk])
+        follow.delete()
+        self.assertEqual(self.timeline(), [])
+
+    def test_new_post_fans_out(self):
+        """Новый пост попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='new')
+        self.assertEqual(self.timeline(), [post.pk])
+
+    @override_settings(TIMELINE_LIMIT=3, TIMELINE_TRIM_EVERY=1)
+    def test_timeline_is_capped(self):
+        """В ленте хранится не больше TIMELINE_LIMIT записей."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'post {i}')
+            for i in range(5)
+        ]
+        self.assertEqual(
+            self.timeline(), [post.pk for post in reversed(posts[-3:])]
+        )
+
+    @override_settings(TIMELINE_LIMIT=1, TIMELINE_TRIM_EVERY=1)
+    def test_fan_out_queries_do_not_grow_with_followers(self):
+        """Раскладка и обрезка идут пачками, а не запросом на подписчика."""
+        readers = [
+            User.objects.create(username=f'timeline_reader_{i}')
+            for i in range(20)
+        ]
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=self.author) for reader in readers
+        )
+        old = Post.objects.create(author=self.author, text='old')
+        post = Post.objects.create(author=self.author, text='new')
+        TimelineEntry.objects.filter(post=post).delete()
+        # Статистика автора, подписчики, вставка и обрезка пачки.
+        with self.assertNumQueries(4):
+            fan_out(post)
+        self.assertEqual(
+            TimelineEntry.objects.filter(post=post).count(), len(readers)
+        )
+        self.assertFalse(TimelineEntry.objects.filter(post=old).exists())
+
+    def test_timeline_is_range_scan(self):
+        """Лента подписок читается по индексу без сортировки."""
+        queryset = TimelineEntry.objects.filter(user_id=1).order_by(
+            '-pub_date', '-post_id'
+        )[:11]
+        plan = query_plan(queryset)
+        self.assertIn('timeline_user_pub_date_idx', ' '.join(plan))
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_follow_feed_uses_for_feed(self):
+        """Посты ленты подписок читаются так же, как в других лентах."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(author=self.author, text='feed')
+        with self.assertNumQueries(3):
+            post, = CursorPaginator(
+                follow_feed(self.reader), 3
+            ).get_cursor_page()
+            self.assertEqual(post.author.username, 'Timeline_author')
+        self.assertIn('email', post.author.get_deferred_fields())
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=2)
+    def test_popular_author_is_pulled(self):
+        """Посты автора с порогом подписчиков подмешиваются при чтении."""
+        fan = User.objects.create(username='Timeline_fan')
+        pushed = User.objects.create(username='Timeline_pushed')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=self.reader, author=pushed)
+        posts = [
+            Post.objects.create(
+                author=(self.author, pushed)[i % 2], text=f'post {i}'
+            )
+            for i in range(7)
+        ]
+        self.assertEqual(
+            TimelineEntry.objects.filter(post__author=self.author).count(),
+            0
+        )
+        paginator = CursorPaginator(follow_feed(self.reader), 3)
+        page = paginator.get_cursor_page()
+        feed = list(page)
+        while page.next_cursor:
+            page = CursorPaginator(
+                follow_feed(self.reader), 3
+            ).get_cursor_page(after=page.next_cursor)
+            feed += list(page)
+        self.assertEqual(
+            [post.pk for post in feed],
+            [post.pk for post in reversed(posts)]
+        )
+
+    @override_settings(TIMELINE_PULL_THRESHOLD=3, TIMELINE_PUSH_THRESHOLD=2)
+    def test_author_below_push_threshold_is_pushed_again(self):
+        """Автор возвращается в push только ниже второго порога."""
+        fans = [
+            User.objects.create(username=f'Timeline_fan_{i}')
+            for i in range(2)
+        ]
+        Follow.objects.create(user=self.reader, author=self.author)
+        for fan in fans:
+            Follow.objects.create(user=fan, author=self.author)
+        post = Post.objects.create(author=self.author, text='pulled')
+        Follow.objects.get(user=fans[0]).delete()
+        Follow.objects.create(user=fans[0], author=self.author)
+        Follow.objects.get(user=fans[0]).delete()
+        self.assertTrue(is_pulled(self.author.pk))
+        self.assertEqual(pending_authors(), [])
+        Follow.objects.get(user=fans[1]).delete()
+        # Дозаполнение идёт вне запроса, до него автор читается как pull.
+        self.assertEqual(self.timeline(), [])
+        self.assertEqual(pending_authors(), [self.author.pk])
+        self.assertEqual(
+            [post.pk for post in CursorPaginator(
+                follow_feed(self.reader), 3
+            ).get_cursor_page()],
+            [post.pk],
+        )
+        call_command('rebuild_timelines', '--pending', stdout=StringIO())
+        self.assertEqual(self.timeline(), [post.pk])
+        self.assertFalse(is_pulled(self.author.pk))
+        self.assertEqual(pending_authors(), [])
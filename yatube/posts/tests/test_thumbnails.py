@@ -0,0 +1,174 @@
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.parsers import parse_geometry
+
+from ..engine import Engine
+from ..models import Post
+from ..thumbnails import (
+    CARD_GEOMETRY, CARD_OPTIONS, forget_image, generate_thumbnails,
+    is_ready, preload,
+)
+from .mixins import MediaTestMixin
+
+User = get_user_model()
+
+
+class ThumbnailTest(MediaTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='User_with_thumbnail')
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.clear_lru()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_upload_queues_thumbnails(self):
+        """Создание и правка поста с картинкой ставят миниатюры в очередь"""
+        with mock.patch('posts.thumbnails.queue_thumbnails') as queued:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Thumbnail', 'image': self.upload('t1.gif')},
+            )
+            post = Post.objects.get(text='Thumbnail')
+            self.assertEqual(queued.call_count, 1)
+            self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                data={'text': 'Thumbnail', 'image': self.upload('t2.gif')},
+            )
+            self.assertEqual(queued.call_count, 2)
+            self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                data={'text': 'Same image'},
+            )
+            self.assertEqual(queued.call_count, 2)
+
+    def test_placeholder_until_ready(self):
+        """До построения миниатюры страница показывает заглушку"""
+        post = Post.objects.create(
+            text='Pending', author=self.user, image=self.upload('t3.gif')
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertFalse(is_ready(post.image))
+        self.assertContains(
+            self.authorized_client.get(url), 'thumbnail_placeholder.svg'
+        )
+        updated = post.updated
+        generate_thumbnails(post.pk)
+        post.refresh_from_db()
+        self.assertTrue(is_ready(post.image))
+        self.assertGreater(post.updated, updated)
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, 'thumbnail_placeholder.svg')
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+
+    def test_picture_srcset(self):
+        """Картинка выводится в нескольких ширинах и в WebP"""
+        post = Post.objects.create(
+            text='Picture', author=self.user, image=self.upload('w.gif')
+        )
+        generate_thumbnails(post.pk)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '.webp 1440w')
+        self.assertContains(response, '.jpg 480w')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(response, 'loading="eager"')
+
+    def test_preload_thumbnails_in_one_query(self):
+        """Записи миниатюр страницы загружаются одним запросом"""
+        posts = [
+            Post.objects.create(
+                text='Preload', author=self.user, image=self.upload('k.gif')
+            )
+            for _ in range(3)
+        ]
+        for post in posts:
+            generate_thumbnails(post.pk)
+        cache.clear()
+        default.kvstore.clear_lru()
+        images = [post.image for post in posts]
+        with CaptureQueriesContext(connection) as queries:
+            preload(images)
+        self.assertEqual(len(queries), 1)
+        with CaptureQueriesContext(connection) as queries, mock.patch.object(
+            cache, 'get', wraps=cache.get
+        ) as cache_get:
+            self.assertTrue(all(is_ready(image) for image in images))
+        self.assertEqual(len(queries), 0)
+        cache_get.assert_not_called()
+
+    def test_image_change_forgets_thumbnails(self):
+        """Замена картинки удаляет записи о миниатюрах старой"""
+        post = Post.objects.create(
+            text='Forget', author=self.user, image=self.upload('f.gif')
+        )
+        generate_thumbnails(post.pk)
+        old_image = post.image.name
+        self.assertTrue(is_ready(old_image))
+        post.image = self.upload('f2.gif')
+        post.save()
+        forget_image(old_image)
+        self.assertFalse(is_ready(old_image))
+
+    def test_prewarm_skips_ready(self):
+        """prewarm_thumbnails пропускает готовые миниатюры"""
+        posts = [
+            Post.objects.create(
+                text='Prewarm', author=self.user, image=self.upload('p.gif')
+            )
+            for _ in range(2)
+        ]
+        generate_thumbnails(posts[0].pk)
+        out = StringIO()
+        call_command(
+            'prewarm_thumbnails', dry_run=True, since='2000-01-01', stdout=out
+        )
+        self.assertIn('К обработке: 1, уже готовы: 1', out.getvalue())
+
+
+class ThumbnailEngineTest(SimpleTestCase):
+    def thumbnail(self, image_format, size):
+        content = BytesIO()
+        Image.new('RGB', size, 'blue').save(content, image_format)
+        engine = Engine()
+        image = engine.get_image(ContentFile(content.getvalue()))
+        options = {**default.backend.default_options, **CARD_OPTIONS}
+        thumbnail = engine.create(
+            image,
+            parse_geometry(
+                CARD_GEOMETRY, engine.get_image_ratio(image, options)
+            ),
+            options,
+        )
+        return image, thumbnail
+
+    def test_large_jpeg_decoded_reduced(self):
+        """Большой JPEG декодируется уменьшенным, миниатюра та же"""
+        image, thumbnail = self.thumbnail('JPEG', (4000, 3000))
+        self.assertEqual(image.size, (2000, 1500))
+        self.assertEqual(thumbnail.size, (960, 339))
+
+    def test_png_decoded_full(self):
+        """PNG декодируется целиком, как раньше"""
+        image, thumbnail = self.thumbnail('PNG', (4000, 3000))
+        self.assertEqual(image.size, (4000, 3000))
+        self.assertEqual(thumbnail.size, (960, 339))
@@ -1,10 +1,22 @@
+import datetime as dt
+import itertools
+from unittest import mock
+
 from django import forms
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase
 from django.urls import reverse
 from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post, Follow
+from .. import search as fts
+from ..cards import card_key, render_cards
+from ..counters import reconcile_counters
+from ..models import Comment, Follow, Group, Post
+from ..paginators import PAGE_WINDOW, CursorPaginator, feed_count_key
 
 
 User = get_user_model()
@@ -48,6 +60,8 @@ class PostsViewsTest(TestCase):
                 )
             )
         Post.objects.bulk_create(bulk)
+        # bulk_create не отправляет сигналы, счётчики правим вручную
+        reconcile_counters()
 
     def setUp(self):
         cache.clear()
@@ -108,6 +122,228 @@ class IndexPageTest(PostsViewsTest):
         self.assertEqual(len(response.context.get('page_obj')), 4)
 
 
+class CursorPaginatorTest(PostsViewsTest):
+    """Тесты курсорного паджинатора."""
+    def test_after_cursor_returns_next_page(self):
+        """Курсор after первой страницы ведёт на остаток ленты."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        response = self.authorized_client.get(
+            reverse('posts:index') + f'?after={first_page.next_cursor}'
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), COUNT_POSTS - 10)
+        self.assertFalse(page_obj.has_next())
+        self.assertTrue(page_obj.has_previous())
+        first_ids = {post.id for post in first_page}
+        self.assertFalse(first_ids & {post.id for post in page_obj})
+
+    def test_before_cursor_returns_previous_page(self):
+        """Курсор before второй страницы возвращает первую."""
+        first_page = self.authorized_client.get(
+            reverse('posts:profile', kwargs={'username': 'DmitryGordon'})
+        ).context['page_obj']
+        second_page = self.authorized_client.get(
+            reverse('posts:profile', kwargs={'username': 'DmitryGordon'})
+            + f'?after={first_page.next_cursor}'
+        ).context['page_obj']
+        response = self.authorized_client.get(
+            reverse('posts:profile', kwargs={'username': 'DmitryGordon'})
+            + f'?before={second_page.previous_cursor}'
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(
+            [post.id for post in page_obj],
+            [post.id for post in first_page]
+        )
+        self.assertFalse(page_obj.has_previous())
+
+    def test_last_page_matches_numbered_pages(self):
+        """Последняя страница и страницы перед ней совпадают с номерными."""
+        url = reverse('posts:index')
+        last = self.authorized_client.get(url + '?before=').context[
+            'page_obj'
+        ]
+        numbered = self.authorized_client.get(url + '?page=2').context[
+            'page_obj'
+        ]
+        self.assertEqual(last.number, 2)
+        self.assertEqual(list(last.page_window), [1, 2])
+        self.assertEqual(
+            [post.id for post in last], [post.id for post in numbered]
+        )
+        previous = self.authorized_client.get(
+            url + f'?before={last.previous_cursor}'
+        ).context['page_obj']
+        first = self.authorized_client.get(url).context['page_obj']
+        self.assertEqual(
+            [post.id for post in previous], [post.id for post in first]
+        )
+
+    def test_cursor_page_has_no_numbers(self):
+        """У страницы по курсору нет окна номеров."""
+        url = reverse('posts:index')
+        first = self.authorized_client.get(url).context['page_obj']
+        page_obj = self.authorized_client.get(
+            url + f'?after={first.next_cursor}'
+        ).context['page_obj']
+        self.assertEqual(list(page_obj.page_window), [])
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор не ломает страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'})
+            + '?after=%%%'
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class FeedCountTest(PostsViewsTest):
+    """Тесты подсчёта постов в паджинаторе."""
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.authorized_client.get(url)
+        return [
+            query['sql'] for query in context.captured_queries
+            if 'COUNT(' in query['sql']
+        ]
+
+    def test_count_is_cached(self):
+        """Повторный запрос главной не считает посты заново."""
+        url = reverse('posts:index')
+        self.assertTrue(self.count_queries(url))
+        self.assertFalse(self.count_queries(url))
+
+    def test_counters_replace_count(self):
+        """Ленты группы и автора берут число постов из счётчиков."""
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'DmitryGordon'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertFalse(self.count_queries(url))
+
+    def test_count_dropped_on_new_post(self):
+        """Новый пост сбрасывает закэшированное число постов."""
+        def count():
+            return CursorPaginator(
+                Post.objects.all(), 10, count_key=feed_count_key('index')
+            ).count
+
+        self.assertEqual(count(), COUNT_POSTS)
+        Post.objects.create(author=self.user, text='new', group=self.group)
+        self.assertEqual(count(), COUNT_POSTS + 1)
+
+    def test_follow_index_without_count(self):
+        """Лента подписок обходится без COUNT(*)."""
+        author = User.objects.create(username='followed')
+        Post.objects.bulk_create(
+            Post(author=author, text='followed') for _ in range(11)
+        )
+        Follow.objects.create(user=self.user, author=author)
+        url = reverse('posts:follow_index')
+        self.assertFalse(self.count_queries(url))
+        response = self.authorized_client.get(url + '?page=2')
+        self.assertEqual(len(response.context['page_obj']), 1)
+        self.assertFalse(response.context['page_obj'].has_next())
+
+    def test_page_window_is_bounded(self):
+        """Ссылок на страницы выводится ограниченное число."""
+        paginator = CursorPaginator(Post.objects.all(), 1)
+        page_obj = paginator.get_page(7)
+        self.assertEqual(
+            list(page_obj.page_window),
+            list(range(7 - PAGE_WINDOW, 7 + PAGE_WINDOW + 1))
+        )
+
+
+class FeedQueriesTest(PostsViewsTest):
+    """Число запросов ленты не зависит от числа авторов и групп."""
+    def add_posts(self, count):
+        for i in range(count):
+            author = User.objects.create(
+                username=f'feed_author_{self.added}',
+                first_name='Feed',
+            )
+            group = Group.objects.create(
+                title=f'Feed group {self.added}',
+                slug=f'feed_group_{self.added}',
+                description='feed',
+            )
+            Post.objects.create(author=author, group=group, text='feed')
+            Follow.objects.create(user=self.user, author=author)
+            self.added += 1
+
+    def feed_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.authorized_client.get(url)
+        return len(context)
+
+    def test_feed_query_count_is_constant(self):
+        """Тест на отсутствие N+1 в лентах."""
+        self.added = 0
+        pages = {
+            'index': reverse('posts:index'),
+            'group_list': reverse(
+                'posts:group_list', kwargs={'slug': 'test_slug'}
+            ),
+            'profile': reverse(
+                'posts:profile', kwargs={'username': 'DmitryGordon'}
+            ),
+            'follow_index': reverse('posts:follow_index'),
+        }
+        self.add_posts(1)
+        expected = {
+            page: self.feed_queries(url) for page, url in pages.items()
+        }
+        self.add_posts(9)
+        for page, url in pages.items():
+            with self.subTest(page=page):
+                self.assertEqual(self.feed_queries(url), expected[page])
+
+
+class PostCardsTest(PostsViewsTest):
+    """Карточки постов берутся из кэша одним get_many."""
+    template = 'includes/post_card.html'
+
+    def setUp(self):
+        super().setUp()
+        self.posts = list(
+            Post.objects.for_feed().order_by('-pub_date', '-pk')[:10]
+        )
+
+    def test_cards_fetched_with_one_get_many(self):
+        render_cards(self.posts, self.template)
+        with mock.patch.object(
+            cache, 'get_many', wraps=cache.get_many
+        ) as get_many, mock.patch(
+            'posts.cards.render_to_string'
+        ) as render:
+            cards = render_cards(self.posts, self.template)
+        get_many.assert_called_once()
+        render.assert_not_called()
+        self.assertEqual(len(cards), 10)
+        self.assertIn(self.posts[0].text, cards[0])
+
+    def test_card_rendered_again_after_edit(self):
+        post = self.posts[0]
+        old_key = card_key(self.template, post)
+        render_cards([post], self.template)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertNotEqual(card_key(self.template, post), old_key)
+        self.assertIn('Новый текст', render_cards([post], self.template)[0])
+
+    def test_cards_shared_between_pages(self):
+        """Страница index с холодным кэшем страниц берёт готовые карточки"""
+        render_cards(self.posts, self.template)
+        with mock.patch('posts.cards.render_to_string') as render:
+            self.authorized_client.get(reverse('posts:index'))
+        render.assert_not_called()
+
+
 class GroupListPageTest(PostsViewsTest):
     """Тесты для страницы group_list."""
     def test_group_list_show_correct_context(self):
@@ -264,9 +500,16 @@ class CacheTest(TestCase):
     def setUpClass(cls):
         super().setUpClass()
         cls.user = User.objects.create(username='Test_user_for_cache')
+        cls.reader = User.objects.create(username='Test_reader_for_cache')
+        cls.group = Group.objects.create(
+            title='Cache group',
+            slug='cache_group',
+            description='cache',
+        )
         Post.objects.create(
             author=cls.user,
-            text='Test cache'
+            text='Test cache',
+            group=cls.group,
         )
 
     def setUp(self):
@@ -274,35 +517,201 @@ class CacheTest(TestCase):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
+    def test_index_served_from_cache(self):
+        """Повторный запрос index отдаётся из кэша"""
+        response = self.authorized_client.get('/')
+        self.assertIsNotNone(response.context)
+        response = self.authorized_client.get('/')
+        # Страница из кэша не отдаёт контекст
+        self.assertIsNone(response.context)
+
     def test_delete_post_and_check_context(self):
-        """Тестирование кэша страницы index"""
-        # проверяем создание поста в базе
-        self.assertTrue(
-            Post.objects.filter(text='Test cache').exists()
+        """Удаление поста сразу сбрасывает кэш страниц"""
+        urls = (
+            '/',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
         )
-        # проверяем создание поста на странице index
-        response = self.authorized_client.get('/')
-        is_in = response.context.get('page_obj')[0]
-        content_before_delete = response.content.decode()
-        self.assertEqual(is_in.text, 'Test cache')
-        # Удаляем пост
+        for url in urls:
+            response = self.authorized_client.get(url)
+            self.assertContains(response, 'Test cache')
         Post.objects.get(text='Test cache').delete()
-        # Проверяем удаление из базы
-        self.assertFalse(
-            Post.objects.filter(text='Test cache').exists(),
-            'Пост не удален из базы'
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertIsNotNone(response.context)
+                self.assertNotContains(response, 'Test cache')
+
+    def test_unrelated_group_keeps_cache(self):
+        """Пост в другой группе не сбрасывает кэш группы"""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.authorized_client.get(url)
+        other = Group.objects.create(
+            title='Other', slug='other', description=''
+        )
+        Post.objects.create(author=self.user, text='Other', group=other)
+        response = self.authorized_client.get(url)
+        self.assertIsNone(response.context)
+
+    def test_group_edit_resets_group_pages(self):
+        """Правка и удаление группы сбрасывают кэш её страниц"""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.authorized_client.get(url)
+        self.authorized_client.get('/')
+        self.group.description = 'Новое описание'
+        self.group.save()
+        self.assertContains(self.authorized_client.get(url), 'Новое описание')
+        self.assertIsNone(self.authorized_client.get('/').context)
+        self.group.delete()
+        self.assertEqual(self.authorized_client.get(url).status_code, 404)
+        self.assertNotContains(
+            self.authorized_client.get('/'), 'все записи группы'
         )
-        # Проверяем кэш на наличие поста
+
+    def test_author_rename_resets_pages(self):
+        """Смена имени автора сбрасывает кэш страниц с его постами"""
+        urls = (
+            '/',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        self.user.last_login = self.user.date_joined
+        self.user.save(update_fields=['last_login'])
+        for url in urls:
+            self.assertIsNone(self.authorized_client.get(url).context)
+        self.user.first_name, self.user.last_name = 'Новое', 'Имя'
+        self.user.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.authorized_client.get(url), 'Новое Имя'
+                )
+
+    def test_follow_resets_index_of_follower(self):
+        """Подписка сбрасывает кэш index только у подписчика"""
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        reader_client.get('/')
+        self.authorized_client.get('/')
+        Follow.objects.create(user=self.reader, author=self.user)
+        response = reader_client.get('/')
+        self.assertIsNotNone(response.context)
         response = self.authorized_client.get('/')
-        # Проверяем, что страница не отдаёт контекст
         self.assertIsNone(response.context)
-        content_after_delete = response.content.decode()
-        # Сравниваем контент страницы до удаления и после
-        self.assertEqual(
-            content_before_delete,
-            content_after_delete
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='conditional_author')
+        cls.group = Group.objects.create(
+            title='Conditional', slug='conditional', description=''
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Conditional'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def revalidate(self, url, response):
+        return self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
         )
 
+    def test_not_modified(self):
+        """Без изменений страница отдаёт 304 без рендеринга"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('no-cache', response['Cache-Control'])
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.revalidate(url, response)
+                self.assertEqual(response.status_code, 304)
+                self.assertIsNone(response.context)
+                self.assertLessEqual(len(queries), 3)
+
+    def test_modified_after_write(self):
+        """Правка поста и комментарий меняют валидаторы"""
+        responses = {url: self.client.get(url) for url in self.urls}
+        self.post.text = 'Изменён'
+        self.post.save()
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                response = self.revalidate(url, response)
+                self.assertEqual(response.status_code, 200)
+        url = self.urls[-1]
+        response = self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_modified_after_group_edit(self):
+        """Правка группы меняет валидаторы страниц группы и её постов"""
+        index, group_list, profile, post_detail = self.urls
+        responses = {url: self.client.get(url) for url in self.urls}
+        self.group.title = 'Новое название'
+        self.group.save()
+        expected = {
+            index: 304, group_list: 200, profile: 304, post_detail: 200,
+        }
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.revalidate(url, response).status_code, expected[url]
+                )
+
+    def test_last_modified_follows_edits_and_deletes(self):
+        """Клиент только с If-Modified-Since видит правку и удаление"""
+        extra = Post.objects.create(
+            author=self.user, group=self.group, text='Удалится'
+        )
+        hour_ago = timezone.now() - dt.timedelta(hours=1)
+        Post.objects.update(pub_date=hour_ago, updated=hour_ago)
+        feeds = self.urls[:3]
+        for change in (
+            lambda: self.post.save(),
+            lambda: extra.delete(),
+        ):
+            cache.clear()
+            Post.objects.update(updated=hour_ago)
+            responses = {url: self.client.get(url) for url in feeds}
+            change()
+            for url, response in responses.items():
+                with self.subTest(url=url):
+                    revalidated = self.client.get(
+                        url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                    )
+                    self.assertEqual(revalidated.status_code, 200)
+
+    def test_no_expires_with_no_cache(self):
+        """Страница из кэша сервера не несёт Expires рядом с no-cache"""
+        for url in self.urls[:2]:
+            with self.subTest(url=url):
+                # Первый ответ отрисован, второй взят из cache_page.
+                for _ in range(2):
+                    response = self.client.get(url)
+                    self.assertIn('max-age=0', response['Cache-Control'])
+                    self.assertFalse(response.has_header('Expires'))
+
+    def test_other_user_gets_full_page(self):
+        url = self.urls[0]
+        response = self.client.get(url)
+        other = Client()
+        other.force_login(User.objects.create(username='conditional_other'))
+        revalidated = other.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 200)
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -381,3 +790,175 @@ class FollowTest(TestCase):
             self.is_in('posts:follow_index', expected_text),
             error_message
         )
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_superuser(
+            'search_admin', 'search@example.com', 'password'
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Поиск по записи номер {i}')
+            for i in range(5)
+        )
+        cls.post_id = Post.objects.create(
+            author=cls.user, text='Берёзовая <роща> и поиски грибов'
+        ).pk
+
+    def setUp(self):
+        self.post = Post.objects.get(pk=self.post_id)
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def search(self, **params):
+        return self.client.get(reverse('posts:search'), params)
+
+    def test_ranked_results_with_snippet(self):
+        """Совпадения подсвечены, текст экранирован, префиксы ищутся"""
+        response = self.search(q='берёз гриб')
+        self.assertEqual(response.context['posts'], [self.post])
+        self.assertContains(
+            response,
+            '<mark>Берёзовая</mark> &lt;роща&gt; и поиски '
+            '<mark>грибов</mark>',
+        )
+
+    def test_keyset_pagination(self):
+        """Страницы по курсору идут подряд в порядке bm25"""
+        # Одинаковые тексты дают одинаковый ранг: порядок решает id.
+        Post.objects.bulk_create(
+            Post(author=self.user, text=text)
+            for text in ['Сосна у дороги'] * 23 + ['Сосна, сосна'] * 2
+        )
+        expected = fts.search('сосна', 100)
+        ranks = [rank for _, rank, _ in expected]
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertLess(len(set(ranks)), len(ranks))
+        posts = []
+        after = None
+        # Курсор, который не сдвигается, не зациклит тест.
+        for pages in range(1, 10):
+            params = {'q': 'сосна'}
+            if after:
+                params['after'] = after
+            response = self.search(**params)
+            self.assertLessEqual(len(response.context['posts']), 10)
+            posts += response.context['posts']
+            after = response.context['next_cursor']
+            if after is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(
+            [post.pk for post in posts],
+            [post_id for post_id, _, _ in expected],
+        )
+
+    def test_broken_cursor_starts_from_first_page(self):
+        for after in ('мусор', fts.encode_cursor('x', 1), '%%%'):
+            with self.subTest(after=after):
+                response = self.search(q='роща', after=after)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['posts'], [self.post])
+
+    def test_index_follows_edit_and_delete(self):
+        self.post.text = 'Осиновая роща'
+        self.post.save()
+        self.assertEqual(self.search(q='берёзовая').context['posts'], [])
+        self.assertEqual(
+            self.search(q='осиновая').context['posts'], [self.post]
+        )
+        self.post.delete()
+        self.assertEqual(self.search(q='осиновая').context['posts'], [])
+
+    def test_fts_syntax_is_not_interpreted(self):
+        response = self.search(q='^(роща* - "')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['posts'], [self.post])
+
+    def test_admin_search_uses_index(self):
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'берёзовая'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post]
+        )
+
+
+class AdminChangeListTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'changelist_admin', 'changelist@example.com', 'password'
+        )
+        cls.groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'admin_{i}')
+            for i in range(3)
+        ]
+        cls.numbers = itertools.count()
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def create_posts(self, count):
+        for i in range(count):
+            number = next(self.numbers)
+            author = User.objects.create(username=f'admin_author_{number}')
+            Post.objects.create(
+                author=author, text=f'Пост {i}', group=self.groups[i % 2]
+            )
+
+    def changelist(self, model, **params):
+        return self.client.get(
+            reverse(f'admin:posts_{model}_changelist'), params
+        )
+
+    def test_query_count_does_not_grow_with_rows(self):
+        counts = []
+        for count in (2, 8):
+            self.create_posts(count)
+            for post in Post.objects.select_related('author'):
+                Comment.objects.create(post=post, author=post.author)
+                Follow.objects.get_or_create(
+                    user=self.admin, author=post.author
+                )
+            with CaptureQueriesContext(connection) as queries:
+                for model in ('post', 'comment', 'follow'):
+                    self.changelist(model)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_editable_group_renders_only_selected_option(self):
+        self.create_posts(1)
+        response = self.changelist('post')
+        self.assertContains(response, self.groups[0].title)
+        self.assertNotContains(response, self.groups[2].title)
+
+    def test_date_hierarchy_probes_periods(self):
+        self.create_posts(3)
+        posts = list(Post.objects.order_by('pk'))
+        for post, year in zip(posts, (2020, 2022, 2022)):
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=timezone.make_aware(dt.datetime(year, 3, year % 7))
+            )
+        years = self.changelist('post').context['cl'].queryset.dates(
+            'pub_date', 'year'
+        )
+        self.assertEqual(years, [dt.date(2020, 1, 1), dt.date(2022, 1, 1)])
+        response = self.changelist('post', pub_date__year=2022)
+        self.assertContains(response, 'pub_date__month=3')
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+    @mock.patch('posts.admin.COUNT_LIMIT', 2)
+    def test_count_is_capped_or_estimated(self):
+        self.create_posts(5)
+        Post.objects.filter(group=self.groups[1]).first().delete()
+        self.assertEqual(
+            self.changelist('post').context['cl'].result_count,
+            Post.objects.aggregate(last=Max('pk'))['last'],
+        )
+        response = self.changelist('post', group__id__exact=self.groups[0].pk)
+        self.assertEqual(response.context['cl'].result_count, 2)
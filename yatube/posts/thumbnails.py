@@ -0,0 +1,180 @@
+"""
+Миниатюры картинок постов, которые готовятся вне запроса.
+
+Загрузка картинки ставит в очередь пул потоков, который строит
+миниатюры всех GEOMETRIES. Шаблоны берут только готовую миниатюру
+из KV-хранилища sorl и до её появления показывают заглушку.
+Когда миниатюры готовы, пост сохраняется заново: у него меняется
+updated, и кэш карточки и страниц сбрасывается.
+"""
+from django.conf import settings
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from core import background, timing
+
+# Миниатюра картинки в карточке поста.
+CARD_GEOMETRY = '960x339'
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+# Ширины вариантов srcset; FALLBACK_WIDTH идёт в src старым браузерам.
+PICTURE_WIDTHS = (480, 960, 1440)
+FALLBACK_WIDTH = 960
+# Форматы вариантов srcset: None - формат миниатюр sorl по умолчанию.
+PICTURE_FORMATS = (None, 'WEBP')
+
+
+def card_geometry(width):
+    card_width, card_height = map(int, CARD_GEOMETRY.split('x'))
+    return f'{width}x{round(width * card_height / card_width)}'
+
+
+# Виды картинки поста: геометрия по ширине и опции. Карточка
+# обрезается до пропорций CARD_GEOMETRY, страница поста показывает
+# картинку целиком.
+PICTURES = {
+    'card': (card_geometry, CARD_OPTIONS),
+    'detail': (str, {'upscale': False}),
+}
+
+
+def picture_variants(kind):
+    """(формат, геометрия, опции, ширина) вариантов картинки вида kind."""
+    geometry, base_options = PICTURES[kind]
+    variants = []
+    for image_format in PICTURE_FORMATS:
+        options = dict(base_options)
+        if image_format:
+            options['format'] = image_format
+        for width in PICTURE_WIDTHS:
+            variants.append((image_format, geometry(width), options, width))
+    return variants
+
+
+# Геометрии и опции всех миниатюр, которые выводят шаблоны.
+GEOMETRIES = tuple(
+    (geometry, options)
+    for kind in PICTURES
+    for _, geometry, options, _ in picture_variants(kind)
+)
+
+
+def thumbnail_options(source, options):
+    """Опции миниатюры, дополненные так же, как это делает sorl."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def source_file(file_):
+    """ImageFile картинки поста; имя из базы - в хранилище поля image."""
+    from .models import Post
+
+    if isinstance(file_, str):
+        return ImageFile(file_, Post._meta.get_field('image').storage)
+    return ImageFile(file_)
+
+
+def thumbnail_file(file_, geometry, **options):
+    """ImageFile миниатюры картинки, даже если она ещё не построена."""
+    source = source_file(file_)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, thumbnail_options(source, options)
+    )
+    return ImageFile(name, default.storage)
+
+
+def ready_thumbnail(file_, geometry, **options):
+    """Готовая миниатюра или None; сама миниатюра не строится."""
+    if not file_:
+        return None
+    with timing.measure('thumb'):
+        return default.kvstore.get(
+            thumbnail_file(file_, geometry, **options)
+        )
+
+
+def preload(images):
+    """Загружает записи миниатюр всех картинок страницы разом."""
+    kvstore = default.kvstore
+    if not hasattr(kvstore, 'preload'):
+        return
+    with timing.measure('thumb'):
+        files = [
+            thumbnail_file(image, geometry, **options)
+            for image in images if image
+            for geometry, options in GEOMETRIES
+        ]
+        if files:
+            kvstore.preload(files)
+
+
+def forget_image(name):
+    """
+    Удаляет записи KV-хранилища и файлы миниатюр картинки,
+    если на неё больше не ссылается ни один пост.
+    """
+    from .models import Post
+
+    if name and not Post.objects.filter(image=name).exists():
+        default.kvstore.delete(source_file(name))
+
+
+def is_ready(file_):
+    return all(
+        ready_thumbnail(file_, geometry, **options)
+        for geometry, options in GEOMETRIES
+    )
+
+
+def build_thumbnails(image, force=False):
+    """Строит все GEOMETRIES картинки; force строит их заново."""
+    image = source_file(image)
+    if force:
+        default.kvstore.delete_thumbnails(image)
+    for geometry, options in GEOMETRIES:
+        get_thumbnail(image, geometry, **options)
+
+
+def generate_thumbnails(post_id):
+    """Строит все миниатюры поста и отмечает пост изменённым."""
+    from .models import Post
+
+    post = Post.objects.filter(pk=post_id).first()
+    # Пост или файл могли удалить, пока задача ждала в очереди.
+    if post is None or not post.image or not post.image.storage.exists(
+        post.image.name
+    ):
+        return
+    build_thumbnails(post.image)
+    post.save(update_fields=['updated'])
+
+
+pool = background.Pool(
+    'thumbnails',
+    generate_thumbnails,
+    'Не удалось построить миниатюры поста %s',
+    max_workers=settings.THUMBNAIL_WORKERS,
+)
+
+
+def queue_depth():
+    """Сколько постов ждут или строят миниатюры в пуле процесса."""
+    return pool.depth()
+
+
+def queue_thumbnails(post_id):
+    """
+    Ставит построение миниатюр поста в пул после коммита транзакции.
+    Без пула миниатюры достроит пул веб-сервера или prewarm_thumbnails.
+    """
+    pool.queue(post_id)
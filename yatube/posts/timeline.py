@@ -0,0 +1,256 @@
+"""
+Лента подписок в гибридном режиме.
+
+Посты обычных авторов раскладываются подписчикам при публикации
+(push), а посты pull-авторов читаются из их ленты при показе
+и сливаются с разложенными записями по ключу (pub_date, id).
+
+Автор становится pull, когда у него TIMELINE_PULL_THRESHOLD
+подписчиков, и возвращается в push, только когда их меньше
+TIMELINE_PUSH_THRESHOLD: автор у порога не переключается туда
+и обратно на каждой подписке. Возврат в push дозаполняет ленты всех
+подписчиков, поэтому делается в фоновом потоке веб-сервера или
+командой rebuild_timelines --pending; до конца дозаполнения автор
+читается как pull.
+"""
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from core import background
+
+from .paginators import FeedSource, MergedFeed
+
+BATCH_SIZE = 500
+
+
+def entries_to_posts(entries):
+    """Превращает записи ленты в посты для шаблона."""
+    return [entry.post for entry in entries]
+
+
+def is_pulled(author_id, apps=global_apps):
+    """Читаются ли посты автора при показе ленты, а не раскладываются."""
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    return AuthorStats.objects.filter(
+        author_id=author_id, pulled=True
+    ).exists()
+
+
+def pulled_authors(user_id):
+    """Авторы из подписок пользователя, чьи посты подмешиваются при чтении."""
+    Follow = global_apps.get_model('posts', 'Follow')
+    return list(
+        Follow.objects.filter(
+            user_id=user_id, author__stats__pulled=True
+        ).values_list('author_id', flat=True)
+    )
+
+
+def follow_feed(user):
+    """Лента подписок: разложенные записи плюс посты pull-авторов."""
+    Post = global_apps.get_model('posts', 'Post')
+    TimelineEntry = global_apps.get_model('posts', 'TimelineEntry')
+    # Посты записей читаются отдельным запросом через for_feed,
+    # как и во всех остальных лентах.
+    entries = TimelineEntry.objects.filter(user=user).prefetch_related(
+        Prefetch('post', queryset=Post.objects.for_feed())
+    )
+    sources = [
+        FeedSource(
+            entries, key=('pub_date', 'post_id'), transform=entries_to_posts
+        )
+    ]
+    sources += [
+        FeedSource(Post.objects.for_feed().filter(author_id=author_id))
+        for author_id in pulled_authors(user.pk)
+    ]
+    return MergedFeed(sources)
+
+
+def trim_timelines(user_ids, apps=global_apps):
+    """
+    Оставляет в лентах пользователей не больше TIMELINE_LIMIT записей
+    одним DELETE на всю пачку.
+    """
+    if not user_ids:
+        return
+    table = apps.get_model('posts', 'TimelineEntry')._meta.db_table
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN ('
+            f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+            f'PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+            f') AS position FROM {table} WHERE user_id IN ({placeholders})'
+            f') AS ranked WHERE position > %s)',
+            [*user_ids, settings.TIMELINE_LIMIT],
+        )
+
+
+def trim_timeline(user_id, apps=global_apps):
+    """Оставляет в ленте пользователя не больше TIMELINE_LIMIT записей."""
+    trim_timelines([user_id], apps)
+
+
+def fan_out(post, apps=global_apps):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Follow = apps.get_model('posts', 'Follow')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    pulled, posts_count = AuthorStats.objects.filter(
+        author_id=post.author_id
+    ).values_list('pulled', 'posts_count').first() or (False, 0)
+    if pulled:
+        return
+    # Обрезка стоит дороже вставки, поэтому ленты подписчиков обрезаются
+    # на каждом TIMELINE_TRIM_EVERY-м посте самого автора.
+    trim = posts_count % settings.TIMELINE_TRIM_EVERY == 0
+    followers = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+    )
+    for start in range(0, len(followers), BATCH_SIZE):
+        batch = followers[start:start + BATCH_SIZE]
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id, post=post, pub_date=post.pub_date
+                )
+                for user_id in batch
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        if trim:
+            trim_timelines(batch, apps)
+
+
+def fill_timeline(user_id, author_id, since=None, apps=global_apps):
+    """Кладёт в ленту свежие посты автора, начиная с since, если задано."""
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    posts = Post.objects.filter(author_id=author_id)
+    if since is not None:
+        posts = posts.filter(pub_date__gte=since)
+    posts = posts.order_by('-pub_date', '-pk').values_list(
+        'pk', 'pub_date'
+    )[:settings.TIMELINE_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timeline(user_id, apps)
+
+
+def backfill(user_id, author_id, apps=global_apps):
+    """Добавляет в ленту свежие посты автора после подписки на него."""
+    if not is_pulled(author_id, apps):
+        fill_timeline(user_id, author_id, apps=apps)
+
+
+def prune(user_id, author_id, apps=global_apps):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def update_mode(author_id):
+    """
+    Переключает автора между push и pull после смены числа подписчиков.
+    Переход в pull мгновенный, возврат в push ставится в фоновый пул.
+    """
+    AuthorStats = global_apps.get_model('posts', 'AuthorStats')
+    stats = AuthorStats.objects.filter(author_id=author_id).values_list(
+        'followers_count', 'pulled'
+    ).first()
+    if stats is None:
+        return
+    followers, pulled = stats
+    if not pulled and followers >= settings.TIMELINE_PULL_THRESHOLD:
+        AuthorStats.objects.filter(author_id=author_id).update(pulled=True)
+    elif pulled and followers < settings.TIMELINE_PUSH_THRESHOLD:
+        queue_restore(author_id)
+
+
+def pending_authors(apps=global_apps):
+    """pull-авторы, которые опустились ниже порога и ждут возврата в push."""
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    return list(
+        AuthorStats.objects.filter(
+            pulled=True,
+            followers_count__lt=settings.TIMELINE_PUSH_THRESHOLD,
+        ).values_list('author_id', flat=True)
+    )
+
+
+def restore_push(author_id, apps=global_apps):
+    """
+    Возвращает автора в push: дозаполняет ленты подписчиков его
+    постами, которые пока он был pull не раскладывались.
+
+    Посты, опубликованные во время дозаполнения, fan_out ещё пропускал,
+    поэтому после переключения они докладываются вторым проходом.
+    """
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Follow = apps.get_model('posts', 'Follow')
+    if author_id not in pending_authors(apps):
+        return
+    started = timezone.now()
+    followers = set(
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+    )
+    for user_id in followers:
+        fill_timeline(user_id, author_id, apps=apps)
+    AuthorStats.objects.filter(author_id=author_id).update(pulled=False)
+    for user_id in Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    ):
+        since = started if user_id in followers else None
+        fill_timeline(user_id, author_id, since, apps)
+
+
+def restore_pending(apps=global_apps):
+    """Возвращает в push всех ждущих авторов; число таких авторов."""
+    authors = pending_authors(apps)
+    for author_id in authors:
+        restore_push(author_id, apps)
+    return len(authors)
+
+
+pool = background.Pool(
+    'timeline', restore_push, 'Не удалось вернуть автора %s в push'
+)
+
+
+def queue_restore(author_id):
+    """
+    Ставит возврат автора в push в пул после коммита транзакции.
+    Без пула автор остаётся pull до rebuild_timelines --pending.
+    """
+    pool.queue(author_id)
+
+
+def rebuild_timelines(apps=global_apps):
+    """Собирает ленты подписок заново по таблице Follow."""
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Follow = apps.get_model('posts', 'Follow')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    AuthorStats.objects.filter(
+        pulled=False,
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD,
+    ).update(pulled=True)
+    TimelineEntry.objects.all().delete()
+    follows = Follow.objects.values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator():
+        backfill(user_id, author_id, apps)
+    restore_pending(apps)
@@ -1,27 +1,39 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.shortcuts import redirect, render, get_object_or_404
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 
 from .models import Post, Group, Comment, Follow
 from .forms import PostForm, CommentForm
+from . import conditional as cond
+from . import search as fts
+from .page_cache import group_scope, user_scope, versioned_cache_page
+from .paginators import CursorPaginator, feed_count_key
+from .thumbnails import preload as preload_thumbnails
+from .timeline import follow_feed
 
 User = get_user_model()
 LIMIT = 10
 
 
-def paginator_func(list, limit, request):
-    paginator = Paginator(list, limit)
+def paginator_func(list, limit, request, **kwargs):
+    paginator = CursorPaginator(list, limit, **kwargs)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if after is not None or before is not None:
+        return paginator.get_cursor_page(after=after, before=before)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
 
 
-@cache_page(20, key_prefix='index_page')
+@cond.conditional(cond.index_etag, cond.index_last_modified)
+@versioned_cache_page(settings.PAGE_CACHE_TIMEOUT, 'global', user_scope)
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
-    page_obj = paginator_func(post_list, LIMIT, request)
+    post_list = Post.objects.for_feed()
+    page_obj = paginator_func(
+        post_list, LIMIT, request, count_key=feed_count_key('index')
+    )
     follow = Follow.objects.filter(user=request.user.is_authenticated)
     if follow.exists():
         following = True
@@ -38,11 +50,15 @@ def index(request):
     return render(request, template, context)
 
 
+@cond.conditional(cond.group_etag, cond.group_last_modified)
+@versioned_cache_page(settings.PAGE_CACHE_TIMEOUT, group_scope)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.groups.filter(group=group)
-    page_obj = paginator_func(posts, LIMIT, request)
+    posts = Post.objects.for_feed().filter(group=group)
+    page_obj = paginator_func(
+        posts, LIMIT, request, total=group.posts_count
+    )
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -50,10 +66,15 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@cond.conditional(cond.profile_etag, cond.profile_last_modified)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.filter(author=author)
-    page_obj = paginator_func(posts, LIMIT, request)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    stats = getattr(author, 'stats', None)
+    posts_count = stats.posts_count if stats else 0
+    posts = Post.objects.for_feed().filter(author=author)
+    page_obj = paginator_func(posts, LIMIT, request, total=posts_count)
     title = 'Последние обновления на сайте'
     if author != request.user:
         is_author = True
@@ -71,6 +92,7 @@ def profile(request, username):
         'page_obj': page_obj,
         'title': title,
         'posts': posts,
+        'posts_count': posts_count,
         'following': following,
         'is_author': is_author,
     }
@@ -87,9 +109,15 @@ def profile(request, username):
 # >       for field in context.keys():
 # E       AttributeError: 'NoneType' object has no attribute 'keys'
 #
+@cond.conditional(cond.post_etag, cond.post_last_modified)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = Comment.objects.filter(post_id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
+    comments = Comment.objects.filter(
+        post_id=post_id
+    ).select_related('author')
+    preload_thumbnails([post.image])
     form = CommentForm(request.POST or None)
     context = {
         'form': form,
@@ -99,6 +127,33 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def search(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    after = fts.decode_cursor(request.GET.get('after', ''))
+    results = fts.search(query, LIMIT + 1, after)
+    page, rest = results[:LIMIT], results[LIMIT:]
+    posts = Post.objects.for_feed().in_bulk(
+        [post_id for post_id, _, _ in page]
+    )
+    found = []
+    # Пост мог исчезнуть между запросом к индексу и чтением постов.
+    for post_id, _, snippet in page:
+        if post_id in posts:
+            posts[post_id].snippet = snippet
+            found.append(posts[post_id])
+    next_cursor = None
+    if rest:
+        post_id, rank, _ = page[-1]
+        next_cursor = fts.encode_cursor(rank, post_id)
+    context = {
+        'query': query,
+        'posts': found,
+        'next_cursor': next_cursor,
+    }
+    return render(request, template, context)
+
+
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -145,7 +200,7 @@ def post_edit(request, post_id):
                 instance=post
             )
             if form.is_valid():
-                PostForm(instance=post, data=request.POST).save()
+                form.save()
                 return redirect('posts:post_detail', post_id=post_id)
             else:
                 return render(request, template, {'form': form})
@@ -168,8 +223,9 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginator_func(posts, LIMIT, request)
+    page_obj = paginator_func(
+        follow_feed(request.user), LIMIT, request, with_count=False
+    )
     title = 'Последние обновления авторов'
     context = {
         'page_obj': page_obj,
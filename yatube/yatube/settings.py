@@ -51,6 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замер охватывал остальные middleware.
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -65,7 +69,10 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIRS = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером рендеринга для Server-Timing.
+        'BACKEND': 'core.template_backends.timed.DjangoTemplates',
+        # Имя по умолчанию взялось бы из пути бэкенда.
+        'NAME': 'django',
         'DIRS': [TEMPLATES_DIRS],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -146,8 +153,105 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Cache
 
+# Кэш в файле SQLite общий для всех воркеров на машине:
+# попадания и сброс версий страниц видны каждому процессу.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            # Суммарный размер значений в байтах.
+            'MAX_SIZE': 64 * 2 ** 20,
+        },
     }
 }
+
+# Страницы лент сбрасываются версиями при записи,
+# поэтому могут храниться долго.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+# Карточка поста в ключе несёт время изменения поста и подписи
+# автора и группы, поэтому тоже может храниться долго.
+POST_CARD_TIMEOUT = 60 * 60 * 6
+
+# Картинки постов
+
+# Длинная сторона загруженной картинки уменьшается до этого размера.
+IMAGE_MAX_SIDE = 2048
+# Качество пережатия загруженных JPEG и WebP.
+IMAGE_JPEG_QUALITY = 85
+
+# Миниатюры картинок
+
+# Сколько потоков строят миниатюры загруженных картинок.
+THUMBNAIL_WORKERS = 2
+# Движок, который декодирует большие JPEG сразу уменьшенными.
+THUMBNAIL_ENGINE = 'posts.engine.Engine'
+# Записи о миниатюрах кэшируются в памяти процесса.
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+# Сколько записей о миниатюрах держит LRU одного процесса.
+THUMBNAIL_LRU_SIZE = 5000
+
+# Замеры запросов
+
+# Строка JSON с замерами каждого запроса. Чтобы выключить лог,
+# достаточно поднять уровень до WARNING переменной окружения
+# TIMING_LOG_LEVEL; заголовок Server-Timing от этого не зависит.
+TIMING_LOG_LEVEL = os.environ.get('TIMING_LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'timing': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'timing': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'timing',
+        },
+    },
+    'loggers': {
+        'core.timing': {
+            'handlers': ['timing'],
+            'level': TIMING_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+# Метрики
+
+# Общий для воркеров файл со снимками их метрик.
+METRICS_DB = os.path.join(BASE_DIR, 'cache', 'metrics.sqlite3')
+# Как часто воркер записывает снимок, в секундах.
+METRICS_FLUSH_INTERVAL = 5
+# Снимки завершившихся воркеров удаляются через столько секунд.
+METRICS_RETENTION = 60 * 60 * 24
+# Токен сборщика метрик; без него /metrics/ открыт только staff.
+METRICS_TOKEN = None
+
+# Профилирование запросов
+
+# Профиль снимается по заголовку X-Profile с токеном из
+# manage.py profile_token или по ?_profile=1 у staff.
+PROFILING_ENABLED = False
+PROFILE_DIR = os.path.join(BASE_DIR, 'cache', 'profiles')
+# Сколько последних профилей хранится.
+PROFILE_KEEP = 50
+# Сколько секунд действует одноразовый токен profile_token.
+PROFILE_TOKEN_MAX_AGE = 5 * 60
+
+# Лента подписок
+
+# Сколько записей хранится в ленте подписок одного пользователя.
+TIMELINE_LIMIT = 1000
+# Ленты подписчиков обрезаются на каждом N-м посте автора.
+TIMELINE_TRIM_EVERY = 100
+# Посты авторов с таким числом подписчиков не раскладываются по лентам,
+# а подмешиваются при чтении.
+TIMELINE_PULL_THRESHOLD = 10000
+# Обратно в ленты посты автора раскладываются, только когда
+# подписчиков стало меньше этого порога.
+TIMELINE_PUSH_THRESHOLD = 9000
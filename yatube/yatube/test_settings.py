@@ -0,0 +1,31 @@
+"""
+Настройки для тестов.
+
+Кэш, метрики, профили и медиа лежат во временном каталоге, а не
+в рабочих файлах сайта: тесты не сбрасывают кэш запущенного сервера
+и не получают ключи, оставшиеся от прошлых запусков. Лог замеров
+не пишет строку на каждый запрос тестового клиента.
+"""
+import atexit
+import copy
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES, LOGGING, os
+
+TEST_DIR = tempfile.mkdtemp(prefix='yatube-test-')
+atexit.register(shutil.rmtree, TEST_DIR, ignore_errors=True)
+
+CACHES = {
+    'default': {
+        **CACHES['default'],
+        'LOCATION': os.path.join(TEST_DIR, 'cache.sqlite3'),
+    }
+}
+METRICS_DB = os.path.join(TEST_DIR, 'metrics.sqlite3')
+PROFILE_DIR = os.path.join(TEST_DIR, 'profiles')
+MEDIA_ROOT = os.path.join(TEST_DIR, 'media')
+
+LOGGING = copy.deepcopy(LOGGING)
+LOGGING['loggers']['core.timing']['level'] = 'WARNING'
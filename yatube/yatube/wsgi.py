@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Миниатюры загруженных картинок и ленты авторов, вернувшихся в push,
+# строят фоновые пулы процесса веб-сервера.
+from core import background  # noqa: E402
+
+background.start_workers()